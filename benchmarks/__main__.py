@@ -0,0 +1,322 @@
+"""Benchmarks for Mopidy-Podcast's hot paths.
+
+Feeds are generated locally, so no network access is needed.  For
+each operation, the best of several runs and the peak memory
+allocated by Python during a separate run are reported.  With
+``--latency``, the latency of browsing a cached feed while another
+client requests slow feeds from a local HTTP server is reported as
+well.  Results can be saved with ``--output`` and compared with a
+previous run using ``--compare`` to detect performance regressions.
+
+"""
+
+import argparse
+import functools
+import gc
+import http.server
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from mopidy import models
+from mopidy_podcast import backend, feeds
+
+from . import generate
+
+
+def get_config(path):
+    return {
+        "podcast": {
+            "browse_root": None,
+            "browse_order": "desc",
+            "browse_limit": 100,
+            "latest_limit": None,
+            "lookup_order": "asc",
+            "comment_limit": None,
+            "search_limit": 100,
+            "cache_size": 1024,
+            "cache_memory": None,
+            "cache_ttl": 86400,
+            "cache_ttl_min": None,
+            "cache_grace": 86400,
+            "cache_persist": False,
+            "cache_dir": None,
+            "timeout": 10,
+            "parser": "stdlib",
+            "parser_processes": None,
+            "parser_threshold": 256,
+            "fetch_wait": None,
+            "refresh_interval": None,
+            "refresh_workers": 4,
+            "refresh_host_limit": 2,
+            "redirect_ttl": None,
+        },
+        "core": {"config_dir": path, "data_dir": path},
+        "proxy": {},
+    }
+
+
+def measure(func, repeat):
+    """Return the best time in seconds and peak memory in bytes."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def walk(library, uri):
+    for ref in library.browse(uri):
+        if ref.type == models.Ref.DIRECTORY:
+            walk(library, ref.uri)
+
+
+def rss_benchmarks(podcast, path, size):
+    filename = os.path.join(path, "feed-%d.xml" % size)
+    with open(filename, "wb") as f:
+        f.write(generate.rss(size))
+    uri = "podcast+file://" + filename
+    library, playback = podcast.library, podcast.playback
+
+    yield "parse", functools.partial(feeds.parse, filename)
+    feed = feeds.parse(filename)
+    yield "tracks", lambda: list(feed.tracks())
+    yield "lookup_cold", lambda: (library.refresh(uri), library.lookup(uri))
+    library.lookup(uri)
+    yield "browse", functools.partial(library.browse, uri)
+    yield "lookup", functools.partial(library.lookup, uri)
+    track = next(feed.tracks(newest_first=True))
+    yield "lookup_track", functools.partial(library.lookup, track.uri)
+    uris = [uri] + [track.uri for track in feed.tracks()]
+    yield "get_images", functools.partial(library.get_images, uris)
+    yield "translate_uri", functools.partial(playback.translate_uri, track.uri)
+    yield "search", functools.partial(library.search, {"any": ["music"]})
+
+
+def opml_benchmarks(podcast, path, fanout, depth):
+    path = tempfile.mkdtemp(prefix="opml-%d-" % fanout, dir=path)
+    filename = generate.opml_tree(path, fanout, depth)
+    uri = "podcast+file://" + filename
+    library = podcast.library
+
+    yield "opml_parse", functools.partial(feeds.parse, filename)
+    yield "opml_walk_cold", lambda: (library.refresh(), walk(library, uri))
+    walk(library, uri)
+    yield "opml_walk", functools.partial(walk, library, uri)
+
+
+class SlowFeedHandler(http.server.BaseHTTPRequestHandler):
+    """Serve generated RSS feeds after the server's `delay`."""
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        data = generate.rss(10, self.path.strip("/"))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def latency_benchmarks(args, path):
+    """Measure the latency of browsing a cached feed while another
+    client keeps requesting feeds that are slow to load."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowFeedHandler)
+    server.delay = args.delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    filename = os.path.join(path, "feed-latency.xml")
+    with open(filename, "wb") as f:
+        f.write(generate.rss(100))
+    uri = "podcast+file://" + filename
+    baseurl = "podcast+http://%s:%d" % server.server_address
+    stopped = threading.Event()
+
+    def client():
+        for index in itertools.count():
+            if stopped.is_set():
+                break
+            # a new feed each time, so every lookup is a cache miss
+            podcast.library.lookup("%s/slow-%d" % (baseurl, index)).get()
+
+    config = get_config(path)
+    config["podcast"]["fetch_wait"] = args.fetch_wait
+    actor = backend.PodcastBackend.start(config, None)
+    podcast = actor.proxy()
+    thread = threading.Thread(target=client)
+    try:
+        podcast.library.browse(uri).get()
+        thread.start()
+        times = []
+        for _ in range(args.latency):
+            start = time.perf_counter()
+            podcast.library.browse(uri).get()
+            times.append(time.perf_counter() - start)
+    finally:
+        stopped.set()
+        if thread.is_alive():
+            thread.join()
+        actor.stop()
+        server.shutdown()
+        server.server_close()
+    for p in (50, 99):
+        yield {
+            "name": "browse_p%d" % p,
+            "size": args.latency,
+            "time": percentile(times, p),
+            "peak": 0,
+        }
+
+
+def run(args, path):
+    podcast = backend.PodcastBackend(get_config(path), None)
+    suites = [
+        (size, rss_benchmarks(podcast, path, size)) for size in args.sizes
+    ] + [
+        (fanout, opml_benchmarks(podcast, path, fanout, args.depth))
+        for fanout in args.fanouts
+    ]
+    try:
+        for size, benchmarks in suites:
+            for name, func in benchmarks:
+                if args.filter and args.filter not in name:
+                    continue
+                seconds, peak = measure(func, args.repeat)
+                yield {
+                    "name": name,
+                    "size": size,
+                    "time": seconds,
+                    "peak": peak,
+                }
+    finally:
+        podcast.on_stop()
+    if args.latency:
+        for result in latency_benchmarks(args, path):
+            if not args.filter or args.filter in result["name"]:
+                yield result
+
+
+def compare(result, baseline, tolerance):
+    try:
+        previous = baseline[result["name"], result["size"]]
+    except KeyError:
+        return ""
+    ratio = result["time"] / previous["time"]
+    if ratio > 1 + tolerance:
+        return "%+.0f%% REGRESSION" % ((ratio - 1) * 100)
+    else:
+        return "%+.0f%%" % ((ratio - 1) * 100)
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=parse_list,
+        default=[10, 100, 1000, 10000, 50000],
+        help="comma-separated numbers of RSS feed items",
+    )
+    parser.add_argument(
+        "-f",
+        "--fanouts",
+        type=parse_list,
+        default=[5, 20, 50],
+        help="comma-separated numbers of OPML entries per directory",
+    )
+    parser.add_argument(
+        "-d", "--depth", type=int, default=2, help="depth of OPML trees"
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="number of timed runs"
+    )
+    parser.add_argument(
+        "-l",
+        "--latency",
+        type=int,
+        default=0,
+        help="number of requests for measuring concurrent latency",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.1,
+        help="response delay in seconds for slow feeds",
+    )
+    parser.add_argument(
+        "--fetch-wait",
+        type=int,
+        default=1,
+        help="fetch_wait config value for measuring latency",
+    )
+    parser.add_argument("-k", "--filter", help="only run matching benchmarks")
+    parser.add_argument("-o", "--output", help="save results as JSON")
+    parser.add_argument("-c", "--compare", help="compare with saved results")
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as regression",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["name"], r["size"]): r for r in json.load(f)}
+    else:
+        baseline = {}
+
+    results = []
+    regressions = 0
+    print(
+        "%-16s %8s %12s %12s" % ("benchmark", "size", "time [ms]", "peak [KiB]")
+    )
+    with tempfile.TemporaryDirectory(prefix="mopidy-podcast-") as path:
+        for result in run(args, path):
+            status = compare(result, baseline, args.tolerance)
+            regressions += status.endswith("REGRESSION")
+            print(
+                "%-16s %8d %12.3f %12.1f  %s"
+                % (
+                    result["name"],
+                    result["size"],
+                    result["time"] * 1000,
+                    result["peak"] / 1024,
+                    status,
+                )
+            )
+            results.append(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Generate synthetic podcast feeds for benchmarking."""
+
+import datetime
+import email.utils
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+WORDS = """
+    about after again all also always another around because before best
+    better between both business called change city come could country
+    data day does down during each early end even every family few find
+    first follow found from game general give good government great group
+    hand have head help here high home house however important into issue
+    just keep kind know large last late lead least life little local long
+    look made make many market might money more most much music must name
+    need never news next night number often only open order other over
+    part people place play point power problem program public question
+    real right room same school science second should show small social
+    some something start state still story study such system take talk
+    than that their them there these thing think this those three through
+    time today together under until very want water week well what when
+    where which while will with without work world year young
+""".split()
+
+RSS_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<rss xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" version="2.0">
+<channel>
+<title>{title}</title>
+<link>http://example.com/{name}/</link>
+<language>en-us</language>
+<itunes:author>{author}</itunes:author>
+<description>{description}</description>
+<itunes:image href="http://example.com/{name}/podcast.jpg" />
+<itunes:category text="Technology" />
+"""
+
+RSS_ITEM = """<item>
+<title>{title}</title>
+<itunes:author>{author}</itunes:author>
+{image}<enclosure url="http://example.com/{name}/{guid}.mp3"
+           length="{size}" type="audio/mpeg" />
+<guid>{guid}</guid>
+<pubDate>{date}</pubDate>
+<itunes:duration>{duration}</itunes:duration>
+<description>{description}</description>
+</item>
+"""
+
+RSS_FOOTER = """</channel>
+</rss>
+"""
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def rss(items, name="podcast", seed=0):
+    """Return an RSS feed with `items` episodes as bytes."""
+    rng = random.Random(seed)
+    authors = [sentence(rng, 2).title() for _ in range(5)]
+    header = RSS_HEADER.format(
+        title=escape(sentence(rng, 4)),
+        name=name,
+        author=escape(authors[0]),
+        description=escape(sentence(rng, 40)),
+    )
+    parts = []
+    date = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+    for index in range(items):
+        date += datetime.timedelta(hours=rng.randint(1, 240))
+        if rng.random() < 0.2:
+            image = "<itunes:image href=%s />\n" % quoteattr(
+                "http://example.com/%s/%d.jpg" % (name, index)
+            )
+        else:
+            image = ""
+        parts.append(
+            RSS_ITEM.format(
+                title=escape("%d: %s" % (index + 1, sentence(rng, 6))),
+                author=escape(rng.choice(authors)),
+                image=image,
+                name=name,
+                guid="%s-%d" % (name, index),
+                size=rng.randint(1000000, 100000000),
+                date=email.utils.format_datetime(date),
+                duration="%d:%02d:%02d"
+                % (rng.randint(0, 2), rng.randint(0, 59), rng.randint(0, 59)),
+                description=escape(
+                    "<p>%s</p>" % sentence(rng, rng.randint(20, 200))
+                ),
+            )
+        )
+    # publication order is not guaranteed
+    rng.shuffle(parts)
+    return (header + "".join(parts) + RSS_FOOTER).encode("utf-8")
+
+
+def opml(outlines):
+    """Return an OPML document for `(type, text, url)` outlines as
+    bytes."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<opml version="2.0">',
+        "<head><title>Podcasts</title></head>",
+        "<body>",
+    ]
+    for kind, text, url in outlines:
+        attr = "xmlUrl" if kind == "rss" else "url"
+        lines.append(
+            "<outline type=%s text=%s %s=%s />"
+            % (quoteattr(kind), quoteattr(text), attr, quoteattr(url))
+        )
+    lines.extend(["</body>", "</opml>", ""])
+    return "\n".join(lines).encode("utf-8")
+
+
+def opml_tree(path, fanout, depth, items=10, seed=0):
+    """Write a tree of OPML files with `fanout` entries per directory
+    to `path`, with RSS feeds of `items` episodes as leaves.
+
+    Returns the path of the root OPML file.
+    """
+
+    def write(name, data):
+        filename = os.path.join(path, name)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return filename
+
+    def directory(name, level):
+        outlines = []
+        for index in range(fanout):
+            child = "%s-%d" % (name, index)
+            if level < depth:
+                filename = directory(child, level + 1)
+                outlines.append(("include", child, "file://" + filename))
+            else:
+                filename = write(child + ".xml", rss(items, child, seed))
+                outlines.append(("rss", child, "file://" + filename))
+        return write(name + ".opml", opml(outlines))
+
+    return directory("root", 1)
@@ -20,13 +20,28 @@ class Extension(ext.Extension):
         schema = super().get_config_schema()
         schema["browse_root"] = config.String(optional=True)
         schema["browse_order"] = config.String(choices=["asc", "desc"])
+        schema["browse_limit"] = config.Integer(optional=True, minimum=1)
+        schema["latest_limit"] = config.Integer(optional=True, minimum=1)
         schema["lookup_order"] = config.String(choices=["asc", "desc"])
+        schema["comment_limit"] = config.Integer(optional=True, minimum=0)
+        schema["search_limit"] = config.Integer(optional=True, minimum=1)
         schema["cache_size"] = config.Integer(minimum=1)
+        schema["cache_memory"] = config.Integer(optional=True, minimum=1)
         schema["cache_ttl"] = config.Integer(minimum=1)
+        schema["cache_ttl_min"] = config.Integer(optional=True, minimum=1)
+        schema["cache_grace"] = config.Integer(optional=True, minimum=0)
+        schema["cache_persist"] = config.Boolean()
+        schema["cache_dir"] = config.Path(optional=True)
         schema["timeout"] = config.Integer(optional=True, minimum=1)
+        schema["parser"] = config.String(choices=["stdlib", "lxml"])
+        schema["parser_processes"] = config.Integer(optional=True, minimum=1)
+        schema["parser_threshold"] = config.Integer(minimum=0)
+        schema["fetch_wait"] = config.Integer(optional=True, minimum=0)
+        schema["refresh_interval"] = config.Integer(optional=True, minimum=1)
+        schema["refresh_workers"] = config.Integer(minimum=1)
+        schema["refresh_host_limit"] = config.Integer(minimum=1)
+        schema["redirect_ttl"] = config.Integer(optional=True, minimum=1)
         # no longer used
-        schema["browse_limit"] = config.Deprecated()
-        schema["search_limit"] = config.Deprecated()
         schema["search_details"] = config.Deprecated()
         schema["update_interval"] = config.Deprecated()
         schema["feeds"] = config.Deprecated()
@@ -45,11 +60,22 @@ class Extension(ext.Extension):
     def get_url_opener(cls, config):
         from urllib.request import ProxyHandler, build_opener
 
+        from .handlers import (
+            ContentEncodingHandler,
+            HTTPHandler,
+            HTTPSHandler,
+            RedirectHandler,
+        )
+
+        handlers = [
+            ContentEncodingHandler(),
+            HTTPHandler(),
+            HTTPSHandler(),
+            RedirectHandler(),
+        ]
         proxy = httpclient.format_proxy(config["proxy"])
         if proxy:
-            handlers = [ProxyHandler({"http": proxy, "https": proxy})]
-        else:
-            handlers = []
+            handlers.append(ProxyHandler({"http": proxy, "https": proxy}))
         opener = build_opener(*handlers)
         user_agent = f"{cls.dist_name}/{cls.version}"
         opener.addheaders = [
@@ -1,40 +1,527 @@
+import concurrent.futures
 import contextlib
 import logging
+import multiprocessing
+import os
+import pathlib
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
 
 import cachetools
 import pykka
-from mopidy import backend
+import uritools
+from mopidy import backend, models
 
 from . import Extension, feeds
-from .library import PodcastLibraryProvider
+from .library import PodcastLibraryProvider, strerror
+from .metrics import Metrics
 from .playback import PodcastPlaybackProvider
+from .refresh import PodcastFeedRefresher
+from .resolve import RedirectResolver
+from .search import PodcastSearchIndex
+from .store import FeedStore
 
 logger = logging.getLogger(__name__)
 
 
+def get_cache_dir(config):
+    if not config[Extension.ext_name]["cache_persist"]:
+        return None
+    cache_dir = config[Extension.ext_name]["cache_dir"]
+    try:
+        if cache_dir:
+            path = pathlib.Path(cache_dir)
+            path.mkdir(parents=True, exist_ok=True)
+        else:
+            path = Extension.get_data_dir(config) / "feeds"
+            path.mkdir(exist_ok=True)
+    except OSError as e:
+        logger.warning(
+            "Cannot access %s cache directory: %s",
+            Extension.dist_name,
+            strerror(e),
+        )
+    except Exception as e:
+        logger.warning(
+            "Cannot access %s cache directory: %s", Extension.dist_name, e
+        )
+    else:
+        return path
+    return None
+
+
+class _CountingReader:
+    def __init__(self, source):
+        self.__source = source
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__source, name)
+
+    def read(self, size=-1):
+        data = self.__source.read(size)
+        self.count += len(data)
+        return data
+
+
 class PodcastFeedCache(cachetools.TTLCache):
 
     pykka_traversable = True
 
+    # fraction of the time between episodes a feed is considered fresh
+    TTL_RATIO = 0.25
+
+    # maximum fraction by which TTLs are shortened to spread requests
+    TTL_JITTER = 0.1
+
+    # seconds for which requests for a feed that could not be retrieved
+    # fail immediately, instead of blocking the backend again
+    ERROR_TTL = 60
+
     def __init__(self, config):
+        memory = config[Extension.ext_name]["cache_memory"]
+        if memory:
+            # weigh cached (feed, timestamp, version, ttl, size) items
+            maxsize, getsizeof = memory * 1024, lambda item: item[4]
+        else:
+            maxsize, getsizeof = config[Extension.ext_name]["cache_size"], None
+        # keep expired feeds for serving while they are revalidated
         super().__init__(
-            maxsize=config[Extension.ext_name]["cache_size"],
-            ttl=config[Extension.ext_name]["cache_ttl"],
+            maxsize=maxsize,
+            ttl=(
+                config[Extension.ext_name]["cache_ttl"]
+                + (config[Extension.ext_name]["cache_grace"] or 0)
+            ),
+            getsizeof=getsizeof,
         )
+        self.__ttl = config[Extension.ext_name]["cache_ttl"]
+        self.__ttl_min = config[Extension.ext_name]["cache_ttl_min"]
         self.__opener = Extension.get_url_opener(config)
         self.__timeout = config[Extension.ext_name]["timeout"]
+        self.__parser = config[Extension.ext_name]["parser"]
+        if self.__parser not in feeds.ENGINES:
+            logger.warning("XML parser %s not available", self.__parser)
+            self.__parser = "stdlib"
+        processes = config[Extension.ext_name]["parser_processes"]
+        if processes:
+            # do not fork a multi-threaded process
+            self.__processes = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self.__processes = None
+        self.__threshold = config[Extension.ext_name]["parser_threshold"] * 1024
+        cache_dir = get_cache_dir(config)
+        self.__store = FeedStore(cache_dir) if cache_dir else None
+        self.__wait = config[Extension.ext_name]["fetch_wait"]
+        self.__interval = config[Extension.ext_name]["refresh_interval"]
+        self.__lock = threading.RLock()
+        self.index = PodcastSearchIndex()
+        self.metrics = Metrics()
+        self.__pending = {}  # coalesce concurrent requests
+        self.__errors = cachetools.TTLCache(
+            maxsize=config[Extension.ext_name]["cache_size"], ttl=self.ERROR_TTL
+        )
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix="PodcastFeedCache"
+        )
+        if self.__store:
+            # stale copies older than this would not be served anyway
+            self.__executor.submit(self.__store.prune, self.ttl)
+
+    def __setitem__(self, uri, feed):
+        self.__put(uri, feed)
+
+    def __delitem__(self, uri):
+        with self.__lock:
+            super().__delitem__(uri)
+            self.index.remove(uri)
+
+    def __contains__(self, uri):
+        with self.__lock:
+            return super().__contains__(uri)
+
+    def expire(self, time=None):
+        with self.__lock:
+            expired = super().expire(time)
+            for uri, _ in expired:
+                self.index.remove(uri)
+        if expired:
+            self.metrics.count("cache.expired", value=len(expired))
+        return expired
+
+    def popitem(self):
+        with self.__lock:
+            uri, value = super().popitem()
+            self.index.remove(uri)
+        self.metrics.count("cache.evicted", self.__host(uri))
+        return uri, value
+
+    def clear(self):
+        with self.__lock:
+            super().clear()
+            self.index.clear()
+
+    def usage(self):
+        """Return a dict mapping cached feed URIs to their approximate
+        memory footprint in bytes."""
+        result = {}
+        with self.__lock:
+            for uri in list(super().__iter__()):
+                result[uri] = super().__getitem__(uri)[4]
+        return result
+
+    def load(self, uri):
+        """Retrieve a feed from the cache, loading it if necessary.
+
+        Raises :class:`TimeoutError` if the feed cannot be retrieved
+        within `fetch_wait` seconds, but keeps loading it in the
+        background.
+
+        """
+        try:
+            return self.__submit(uri).result(timeout=self.__wait)
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError(
+                f"Still loading after {self.__wait} seconds"
+            ) from None
+
+    def getmany(self, uris):
+        """Retrieve multiple feeds concurrently.
+
+        Returns a dict mapping URIs to feeds; feeds that cannot be
+        retrieved within `fetch_wait` seconds are omitted.
+
+        """
+        futures = {uri: self.__submit(uri) for uri in uris}
+        concurrent.futures.wait(futures.values(), timeout=self.__wait)
+        result = {}
+        for uri, future in futures.items():
+            if not future.done():
+                logger.error("Error retrieving %s: Still loading", uri)
+            elif future.exception():
+                logger.error("Error retrieving %s: %s", uri, future.exception())
+            else:
+                result[uri] = future.result()
+        return result
+
+    def subscriptions(self, root):
+        """Return references to all directories and feeds reachable
+        from directory `root`, including remote directories.
+
+        Directories are retrieved level by level, so the directories
+        on each level are fetched concurrently.
+
+        """
+        refs = []
+        visited = {root}
+        level = [root]
+        while level:
+            directories = self.getmany(level)
+            level = []
+            for directory in directories.values():
+                for ref in directory.items():
+                    if ref.uri in visited:
+                        continue
+                    visited.add(ref.uri)
+                    if ref.type == models.Ref.DIRECTORY:
+                        level.append(ref.uri)
+                        refs.append(ref)
+                    elif ref.type == models.Ref.ALBUM:
+                        refs.append(ref)
+        return refs
 
-    def __missing__(self, uri):
+    def fetch(self, uri, revalidate=False):
+        """Retrieve a feed bypassing the in-memory cache and store the
+        result; if `revalidate` is true, also check whether a persistent
+        copy is still up-to-date.
+
+        Concurrent calls for the same URI share a single request.
+
+        """
+        with self.__lock:
+            pending = self.__pending.get(uri)
+            if pending is None:
+                future = self.__pending[uri] = concurrent.futures.Future()
+        if pending is not None:
+            return pending.result()
+        try:
+            feed = self.__retrieve(uri, revalidate)
+        except Exception as e:
+            with self.__lock:
+                self.__errors[uri] = e
+            future.set_exception(e)
+            raise
+        else:
+            with self.__lock:
+                self.__errors.pop(uri, None)
+            future.set_result(feed)
+            return feed
+        finally:
+            with self.__lock:
+                del self.__pending[uri]
+
+    def invalidate(self, uri=None):
+        """Remove a feed from the cache and force revalidation of its
+        persistent copy, or invalidate all feeds if `uri` is `None`."""
+        # only drop cached entries here; never wait for loads while
+        # holding the lock
+        with self.__lock:
+            if uri is None:
+                self.clear()
+                self.__errors.clear()
+            else:
+                super().pop(uri, None)
+                self.__errors.pop(uri, None)
+        if self.__store:
+            self.__store.expire(uri)
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
+        if self.__processes:
+            self.__processes.shutdown(wait=False)
+        # release pooled keep-alive connections
+        for handler in self.__opener.handlers:
+            handler.close()
+
+    def __retrieve(self, uri, revalidate):
+        host = self.__host(uri)
+        try:
+            with self.metrics.timer("retrieve.time", host):
+                return self.__retrieve_feed(uri, revalidate)
+        except Exception:
+            self.metrics.count("retrieve.errors", host)
+            raise
+
+    def __retrieve_feed(self, uri, revalidate):
         ext_name, _, feedurl = uri.partition("+")
         assert ext_name == Extension.ext_name
-        f = self.__opener.open(feedurl, timeout=self.__timeout)
+        # reuse unchanged episodes of the currently cached feed
+        with self.__lock:
+            try:
+                previous, timestamp, _, ttl, _ = super().__getitem__(uri)
+            except KeyError:
+                previous, updated = None, None
+            else:
+                updated = time.time() - (self.timer() - timestamp)
+        # validate local feeds on access so updates are available
+        # immediately; stat before parsing to detect concurrent changes
+        if feedurl.startswith("file:"):
+            version = self.__stat(feedurl)
+            feed = self.__fetch(feedurl, previous)
+            self.__put(uri, feed, version=version)
+            return feed
+        # with adaptive TTLs, only revalidate feeds likely to have changed
+        if self.__ttl_min and revalidate and previous is not None:
+            if self.timer() - timestamp < ttl:
+                logger.debug("Not revalidating %s yet", uri)
+                return previous
+        if self.__store:
+            feed, timestamp = self.__load(
+                uri, feedurl, revalidate, previous, updated
+            )
+        else:
+            feed, timestamp = self.__fetch(feedurl, previous), time.time()
+        # keep in-memory expiration consistent with persistent copy
+        self.__put(uri, feed, time.time() - timestamp)
+        return feed
+
+    def __put(self, uri, feed, age=0, version=None):
+        ttl = self.__getttl(uri, feed)
+        timestamp = self.timer() - age
+        # the search index may take as much memory as the feed itself
+        size = feed.getsize() + self.index.add(uri, feed)
+        with self.__lock:
+            try:
+                super().__setitem__(uri, (feed, timestamp, version, ttl, size))
+            except ValueError as e:
+                logger.warning("Cannot cache %s: %s", uri, e)
+                if super().__contains__(uri):
+                    self.__delitem__(uri)
+                else:
+                    self.index.remove(uri)
+                return
+            logger.debug(
+                "Cached %s (size %d, total %d of %d)",
+                uri,
+                size,
+                self.currsize,
+                self.maxsize,
+            )
+
+    def __submit(self, uri):
+        with self.__lock:
+            try:
+                feed, timestamp, version, ttl, _ = super().__getitem__(uri)
+            except KeyError:
+                feed = None
+            else:
+                if version is not None:
+                    _, _, feedurl = uri.partition("+")
+                    if version != self.__stat(feedurl):
+                        logger.debug("Reloading modified feed %s", uri)
+                        feed = None
+                elif self.timer() - timestamp >= ttl:
+                    self.metrics.count("cache.stale", self.__host(uri))
+                    self.__revalidate(uri)
+            if feed is None:
+                self.metrics.count("cache.misses", self.__host(uri))
+                future = self.__pending.get(uri)
+                error = self.__errors.get(uri)
+                if future is None and error is not None:
+                    logger.debug("Not retrying %s yet: %s", uri, error)
+                    future = concurrent.futures.Future()
+                    future.set_exception(error)
+            else:
+                self.metrics.count("cache.hits", self.__host(uri))
+                future = concurrent.futures.Future()
+                future.set_result(feed)
+        if future is None:
+            future = self.__executor.submit(self.fetch, uri)
+        return future
+
+    def __revalidate(self, uri):
+        def revalidate():
+            try:
+                self.fetch(uri, revalidate=True)
+            except Exception as e:
+                logger.warning("Error revalidating %s: %s", uri, e)
+
+        if uri not in self.__pending:
+            logger.debug("Serving %s while revalidating", uri)
+            self.__executor.submit(revalidate)
+
+    def __fetch(self, feedurl, previous=None):
+        with self.metrics.timer("fetch.time", self.__host(feedurl)):
+            f = self.__opener.open(feedurl, timeout=self.__timeout)
+        with contextlib.closing(f) as source:
+            return self.__parse(source, previous)
+
+    def __load(
+        self, uri, feedurl, revalidate=False, previous=None, updated=None
+    ):
+        entry = self.__store.load(uri)
+        if entry is not None and (
+            self.__ttl_min or not revalidate or self.__shared(entry, updated)
+        ):
+            ttl = self.__getttl(uri, entry.feed)
+            if time.time() - entry.timestamp < ttl:
+                logger.debug("Loaded %s from persistent cache", uri)
+                return entry.feed, entry.timestamp
+        # keep processes sharing the cache directory from retrieving the
+        # same feed at once; use the result of whoever got there first
+        start = time.time()
+        with self.__store.lock(uri) as waited:
+            if waited:
+                entry = self.__store.load(uri)
+                if entry is not None and entry.timestamp >= start:
+                    logger.debug("Loaded %s updated by other process", uri)
+                    self.metrics.count("store.shared", self.__host(feedurl))
+                    return entry.feed, entry.timestamp
+            return self.__update(uri, feedurl, entry, previous)
+
+    def __shared(self, entry, updated=None):
+        # whether another process sharing the cache directory has updated
+        # or revalidated the persistent copy since the in-memory copy was
+        # retrieved, or during the current refresh interval
+        if updated is not None and entry.timestamp > updated:
+            return True
+        elif self.__interval:
+            return time.time() - entry.timestamp < self.__interval
+        else:
+            return False
+
+    def __update(self, uri, feedurl, entry, previous=None):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.modified:
+                headers["If-Modified-Since"] = entry.modified
+        request = urllib.request.Request(feedurl, headers=headers)
+        try:
+            with self.metrics.timer("fetch.time", self.__host(feedurl)):
+                f = self.__opener.open(request, timeout=self.__timeout)
+        except urllib.error.HTTPError as e:
+            if entry is None or e.code != 304:
+                return self.__stale(uri, entry, e)
+            e.close()
+            logger.debug("Feed %s not modified", feedurl)
+            self.metrics.count("fetch.not_modified", self.__host(feedurl))
+            self.__store.touch(uri)
+            return entry.feed, time.time()
+        except Exception as e:
+            return self.__stale(uri, entry, e)
+        if previous is None and entry is not None:
+            previous = entry.feed
         with contextlib.closing(f) as source:
-            feed = feeds.parse(source)
-        # do not cache local URIs so updates are available immediately
-        if not feedurl.startswith("file:"):
-            self[uri] = feed
+            feed = self.__parse(source, previous)
+            etag = source.headers.get("ETag")
+            modified = source.headers.get("Last-Modified")
+        self.__store.save(uri, feed, etag, modified)
+        return feed, time.time()
+
+    def __parse(self, source, previous=None):
+        host = self.__host(source.geturl())
+        with self.metrics.timer("parse.time", host):
+            if self.__processes:
+                data = source.read()
+                feed = self.__parse_data(data, source.geturl(), previous)
+                size = len(data)
+            else:
+                # parse incrementally while the feed is being downloaded
+                reader = _CountingReader(source)
+                feed = feeds.parse(reader, previous, self.__parser)
+                size = reader.count
+        self.metrics.count("parse.bytes", host, size)
+        # for compressed responses, count the bytes actually downloaded
+        decoder = getattr(source, "decoder", None)
+        if decoder is not None:
+            size = decoder.count
+        self.metrics.count("fetch.bytes", host, size)
         return feed
 
+    def __parse_data(self, data, url, previous=None):
+        if len(data) < self.__threshold:
+            return feeds.fromstring(data, url, previous, self.__parser)
+        # passing the previous feed would outweigh reusing its episodes
+        future = self.__processes.submit(
+            feeds.fromstring, data, url, None, self.__parser
+        )
+        return future.result()
+
+    def __getttl(self, uri, feed):
+        ttl = self.__ttl
+        interval = feed.getinterval() if self.__ttl_min else None
+        if interval is not None:
+            ttl = min(max(interval * self.TTL_RATIO, self.__ttl_min), ttl)
+        # keep feeds loaded at the same time from expiring together; use a
+        # fixed jitter per feed so it is consistent across calls
+        return ttl * (1 - self.TTL_JITTER * random.Random(uri).random())
+
+    @staticmethod
+    def __host(url):
+        return uritools.urisplit(url).gethost() or "localhost"
+
+    @staticmethod
+    def __stat(feedurl):
+        try:
+            st = os.stat(uritools.urisplit(feedurl).getpath())
+        except OSError:
+            return None
+        else:
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def __stale(self, uri, entry, error):
+        if entry is None or time.time() - entry.timestamp >= self.ttl:
+            raise error
+        logger.warning("Error retrieving %s, using stale copy: %s", uri, error)
+        return entry.feed, entry.timestamp
+
 
 class PodcastBackend(pykka.ThreadingActor, backend.Backend):
 
@@ -43,5 +530,56 @@ class PodcastBackend(pykka.ThreadingActor, backend.Backend):
     def __init__(self, config, audio):
         super().__init__()
         self.feeds = PodcastFeedCache(config)
+        if config[Extension.ext_name]["redirect_ttl"]:
+            self.resolver = RedirectResolver(
+                Extension.get_url_opener(config),
+                ttl=config[Extension.ext_name]["redirect_ttl"],
+                timeout=config[Extension.ext_name]["timeout"],
+            )
+        else:
+            self.resolver = None
         self.library = PodcastLibraryProvider(config, backend=self)
         self.playback = PodcastPlaybackProvider(audio, backend=self)
+        self.__refresher = None
+        self.__config = config
+
+    def on_start(self):
+        interval = self.__config[Extension.ext_name]["refresh_interval"]
+        root = self.library.root_directory
+        if interval and root:
+            self.__refresher = PodcastFeedRefresher(
+                self.feeds,
+                root.uri,
+                interval=interval,
+                workers=self.__config[Extension.ext_name]["refresh_workers"],
+                host_limit=self.__config[Extension.ext_name][
+                    "refresh_host_limit"
+                ],
+            )
+            self.__refresher.start()
+
+    def stats(self, key=None):
+        """Return a dict of runtime metrics and cache statistics.
+
+        If `key` is given, only return metrics recorded for that host.
+
+        """
+        result = self.feeds.metrics.stats(key)
+        if key is None:
+            result.update(
+                {
+                    "cache.count": len(self.feeds),
+                    "cache.currsize": self.feeds.currsize,
+                    "cache.maxsize": self.feeds.maxsize,
+                }
+            )
+        return result
+
+    def on_stop(self):
+        self.feeds.metrics.log(logger)
+        if self.__refresher:
+            self.__refresher.stop()
+            self.__refresher = None
+        if self.resolver:
+            self.resolver.close()
+        self.feeds.close()
@@ -1,6 +1,16 @@
+import bisect
+import collections
 import datetime
 import email.utils
+import hashlib
+import html
+import io
 import re
+import sys
+import time
+import urllib.response
+import xml.etree.ElementTree as ElementTree
+import zlib
 
 import uritools
 from mopidy import models
@@ -8,25 +18,93 @@ from mopidy import models
 from . import Extension
 
 try:
-    import xml.etree.cElementTree as ElementTree
+    import lxml.etree
 except ImportError:
-    import xml.etree.ElementTree as ElementTree
+    lxml = None
 
+EVENTS = ("start", "end")
 
-def parse(source):
+# elements feed parsers need to see; other events may be skipped
+TAGS = ("rss", "channel", "item", "opml", "body", "outline")
+
+ENGINES = {
+    "stdlib": lambda source: ElementTree.iterparse(source, events=EVENTS),
+}
+
+if lxml is not None:
+    # recover from common errors, but never resolve external entities
+    ENGINES["lxml"] = lambda source: lxml.etree.iterparse(
+        source,
+        events=EVENTS,
+        tag=TAGS,
+        recover=True,
+        resolve_entities=False,
+    )
+
+
+def parse(source, previous=None, engine="stdlib"):
+    """Parse a podcast feed.
+
+    If `previous` is a feed parsed from the same URL, episodes that
+    have not changed since are reused instead of being processed again.
+
+    `engine` selects the XML parser from `ENGINES`.
+    """
     if isinstance(source, str):
         url = uritools.uricompose("file", "", source)
     else:
         url = source.geturl()
-    root = ElementTree.parse(source).getroot()
+    if engine == "lxml" and isinstance(source, io.TextIOBase):
+        engine = "stdlib"  # lxml only reads bytes
+    events = ENGINES[engine](source)
+    try:
+        _, root = next(events)
+    except StopIteration:
+        raise TypeError("Not a recognized podcast feed: %s", url) from None
     if root.tag == "rss":
-        return RssFeed(url, root)
+        return RssFeed(url, events, previous)
     elif root.tag == "opml":
-        return OpmlFeed(url, root)
+        return OpmlFeed(url, events)
     else:
         raise TypeError("Not a recognized podcast feed: %s", url)
 
 
+def fromstring(data, url, previous=None, engine="stdlib"):
+    """Parse a podcast feed retrieved from `url` from bytes.
+
+    Arguments and results are picklable, so this may also be called
+    in a separate process.
+    """
+    source = urllib.response.addinfourl(io.BytesIO(data), {}, url)
+    return parse(source, previous, engine)
+
+
+def getsizeof(obj, seen=None):
+    """Return the approximate memory footprint of `obj` in bytes,
+    including the contents of containers and models.
+
+    Objects referenced more than once are only counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, type(None))):
+        pass
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            size += getsizeof(key, seen) + getsizeof(value, seen)
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        for item in obj:
+            size += getsizeof(item, seen)
+    elif isinstance(obj, models.ImmutableObject):
+        for name in obj._fields:
+            size += getsizeof(getattr(obj, name), seen)
+    return size
+
+
 def get_url(source, default=None):
     """
     Get URL from xml.etree.ElementTree.Element.
@@ -37,6 +115,10 @@ def get_url(source, default=None):
 
 
 class PodcastFeed:
+
+    # period of episodes without a publication date
+    UNDATED = "undated"
+
     def __init__(self, url):
         self.uri = self.getfeeduri(url)
 
@@ -47,18 +129,47 @@ class PodcastFeed:
     def getitemuri(self, guid, safe=uritools.SUB_DELIMS + ":@/?"):
         return self.uri + "#" + uritools.uriencode(guid, safe=safe).decode()
 
+    def getsize(self):
+        """Return the approximate memory footprint of the feed in bytes."""
+        try:
+            return self.__size
+        except AttributeError:
+            self.__size = getsizeof(vars(self))
+        return self.__size
+
+    def getimages(self, uri):
+        return []
+
+    def getinterval(self):
+        """Return the estimated time between new episodes in seconds,
+        or `None` if unknown."""
+        return None
+
     def getstreamuri(self, guid):
         raise NotImplementedError
 
-    def items(self, newest_first=None):
+    def gettimestamp(self, uri):
+        return None
+
+    def gettrack(self, uri, comment_limit=None):
+        return None
+
+    def items(self, newest_first=None, period=None, limit=None):
         raise NotImplementedError
 
-    def tracks(self, newest_first=None):
+    def periods(self, period=None):
+        return []
+
+    def tracks(self, newest_first=None, period=None, comment_limit=None):
         return []
 
     def images(self):
         return []
 
+    def latest(self):
+        """Return (timestamp, ref) pairs for episodes, newest first."""
+        return []
+
 
 class RssFeed(PodcastFeed):
 
@@ -75,77 +186,299 @@ class RssFeed(PodcastFeed):
         flags=re.VERBOSE,
     )
 
-    def __init__(self, url, root):
-        super().__init__(url)
-        self.__channel = channel = root.find("channel")
-        items = channel.findall("./item/enclosure[@url]/..")
-        self.__items = list(sorted(items, key=self.__order))
+    TAG_RE = re.compile(r"<[^>]*>")
 
-    def getstreamuri(self, guid):
-        for item in self.__items:
-            if self.__guid(item) == guid:
-                return get_url(item.find("enclosure"))
-        return None
+    # show notes often dominate a feed's size, so keep longer ones
+    # compressed until tracks are requested
+    COMPRESS_SIZE = 1024
 
-    def items(self, newest_first=False):
-        for item in reversed(self.__items) if newest_first else self.__items:
-            yield models.Ref.track(
-                uri=self.getitemuri(self.__guid(item)),
-                name=item.findtext("title"),
-            )
+    class Channel(
+        collections.namedtuple("Channel", "title author genre image")
+    ):
+        __slots__ = ()
+
+    class Episode(
+        collections.namedtuple(
+            "Episode",
+            "guid uri url title date length image author comment timestamp "
+            "digest",
+        )
+    ):
+        __slots__ = ()
 
-    def tracks(self, newest_first=False):
-        album = models.Album(
+    def __init__(self, url, events, previous=None):
+        super().__init__(url)
+        if isinstance(previous, RssFeed) and previous.uri == self.uri:
+            known = {e.digest: e for e in previous.__episodes}
+        else:
+            known = {}
+        self.__channel, episodes = self.__parse(events, known)
+        # mostly presorted when reusing episodes, so this is cheap
+        self.__episodes = list(sorted(episodes, key=self.__order))
+        # map guids and item URIs to episode indices for fast access
+        self.__guids = {}
+        self.__uris = {}
+        for index, episode in enumerate(self.__episodes):
+            self.__guids.setdefault(episode.guid, index)
+            self.__uris.setdefault(episode.uri, index)
+        # ISO dates in publication order for selecting periods
+        self.__dates = [episode.date or "" for episode in self.__episodes]
+        # share model instances between tracks
+        authors = {self.__channel.author}
+        authors.update(episode.author for episode in self.__episodes)
+        self.__artists = {
+            name: frozenset([models.Artist(name=name)])
+            for name in authors
+            if name
+        }
+        self.__album = models.Album(
             uri=self.uri,
-            name=self.__channel.findtext("title"),
-            artists=self.__artists(self.__channel),
-            num_tracks=len(self.__items),
+            name=self.__channel.title,
+            artists=self.__artists.get(self.__channel.author),
+            num_tracks=len(self.__episodes),
         )
-        genre = self.__genre(self.__channel)
-        items = enumerate(self.__items, start=1)
-        for index, item in reversed(list(items)) if newest_first else items:
-            yield models.Track(
-                uri=self.getitemuri(self.__guid(item)),
-                name=item.findtext("title"),
-                album=album,
-                artists=(self.__artists(item) or album.artists),
-                genre=genre,
-                date=self.__date(item),
-                length=self.__length(item),
-                comment=item.findtext("description"),
-                track_no=index,
-            )
+
+    def getimages(self, uri):
+        default = self.__channel.image
+        if uri == self.uri:
+            return [default] if default else []
+        try:
+            index = self.__uris[uri]
+        except KeyError:
+            return []
+        image = self.__episodes[index].image or default
+        return [image] if image else []
+
+    def getinterval(self, count=10):
+        # median of recent intervals, unless the feed has been dormant
+        # for longer
+        timestamps = [e.timestamp for e in self.__episodes[-count - 1 :]]
+        timestamps = [t for t in timestamps if t]
+        if len(timestamps) < 2:
+            return None
+        intervals = sorted(b - a for a, b in zip(timestamps, timestamps[1:]))
+        median = intervals[len(intervals) // 2]
+        return max(median, time.time() - timestamps[-1])
+
+    def getstreamuri(self, guid):
+        try:
+            index = self.__guids[guid]
+        except KeyError:
+            return None
+        else:
+            return self.__episodes[index].url
+
+    def gettimestamp(self, uri):
+        """Return the publication time of episode `uri` as a POSIX
+        timestamp, or `None`."""
+        try:
+            index = self.__uris[uri]
+        except KeyError:
+            return None
+        else:
+            return self.__episodes[index].timestamp
+
+    def gettrack(self, uri, comment_limit=None):
+        """Return the track for episode `uri`, or `None`.
+
+        If `comment_limit` is given, the episode's description is
+        converted to plain text and shortened to at most that many
+        characters.
+
+        """
+        try:
+            index = self.__uris[uri]
+        except KeyError:
+            return None
+        else:
+            return self.__track(index, comment_limit)
+
+    def items(self, newest_first=False, period=None, limit=None):
+        for index in self.__indices(newest_first, period, limit):
+            episode = self.__episodes[index]
+            yield models.Ref.track(uri=episode.uri, name=episode.title)
+
+    def latest(self):
+        for episode in reversed(self.__episodes):
+            ref = models.Ref.track(uri=episode.uri, name=episode.title)
+            yield episode.timestamp or 0, ref
+
+    def periods(self, period=None):
+        """Return (period, count) pairs for the years episodes were
+        published in, or for the months of the year `period`.
+
+        Episodes without a publication date are counted as period
+        `UNDATED`, which precedes all years.
+
+        """
+        if period is None:
+            start, stop = bisect.bisect_right(self.__dates, ""), None
+            if start:
+                yield self.UNDATED, start
+        elif len(period) == 4:
+            start, stop = self.__range(period)
+        else:
+            return
+        dates = self.__dates
+        size = len(period) + 3 if period else 4
+        stop = len(dates) if stop is None else stop
+        while start < stop:
+            key = dates[start][:size]
+            end = bisect.bisect_left(dates, key + "\uffff", start, stop)
+            yield key, end - start
+            start = end
+
+    def tracks(self, newest_first=False, period=None, comment_limit=None):
+        for index in self.__indices(newest_first, period):
+            yield self.__track(index, comment_limit)
 
     def images(self):
-        image = self.__image(self.__channel)
+        image = self.__channel.image
         default = [image] if image else None
         if default:
             yield self.uri, default
-        for item in self.__items:
-            image = self.__image(item)
-            if image:
-                yield self.getitemuri(self.__guid(item)), [image]
+        for episode in self.__episodes:
+            if episode.image:
+                yield episode.uri, [episode.image]
             elif default:
-                yield self.getitemuri(self.__guid(item)), default
+                yield episode.uri, default
             else:
                 pass
 
-    @classmethod
-    def __artists(cls, etree):
-        elem = etree.find(cls.ITUNES_PREFIX + "author")
-        if elem is not None and elem.text:
-            return [models.Artist(name=elem.text)]
+    def __indices(self, newest_first, period=None, limit=None):
+        if period:
+            start, stop = self.__range(period)
         else:
+            start, stop = 0, len(self.__episodes)
+        if limit:
+            start = max(start, stop - limit)
+        indices = range(start, stop)
+        return reversed(indices) if newest_first else indices
+
+    def __range(self, period):
+        if period == self.UNDATED:
+            return 0, bisect.bisect_right(self.__dates, "")
+        start = bisect.bisect_left(self.__dates, period)
+        stop = bisect.bisect_left(self.__dates, period + "\uffff", start)
+        return start, stop
+
+    def __track(self, index, comment_limit=None):
+        episode = self.__episodes[index]
+        return models.Track(
+            uri=episode.uri,
+            name=episode.title,
+            album=self.__album,
+            artists=self.__artists.get(episode.author, self.__album.artists),
+            genre=self.__channel.genre,
+            date=episode.date,
+            length=episode.length,
+            comment=self.__comment(episode.comment, comment_limit),
+            track_no=index + 1,
+        )
+
+    @classmethod
+    def __comment(cls, comment, limit=None):
+        if comment is None or limit == 0:
             return None
+        if isinstance(comment, bytes):
+            comment = zlib.decompress(comment).decode("utf-8")
+        if limit is None:
+            return comment
+        text = " ".join(html.unescape(cls.TAG_RE.sub(" ", comment)).split())
+        if len(text) > limit:
+            text = text[: limit - 1].rstrip() + "\u2026"
+        return text or None
 
     @classmethod
-    def __date(cls, etree):
-        text = etree.findtext("pubDate")
+    def __compress(cls, text):
+        if text is None or len(text) < cls.COMPRESS_SIZE:
+            return text
+        # favor speed, since this is done for every new episode
+        data = zlib.compress(text.encode("utf-8"), 1)
+        return data if len(data) < len(text) else text
+
+    def __parse(self, events, known):
+        # only keep the current <item> element in memory while parsing
+        channel = record = None
+        episodes = []
+        stack = []  # open elements below the root reported by the parser
+        for event, elem in events:
+            if event == "start":
+                if not stack and channel is None and elem.tag == "channel":
+                    channel = elem
+                stack.append(elem)
+                continue
+            elif not stack:
+                continue  # end of root element
+            stack.pop()
+            if len(stack) == 1 and stack[0] is channel and elem.tag == "item":
+                episode = self.__episode(elem, known)
+                if episode is not None:
+                    episodes.append(episode)
+                channel.remove(elem)
+            elif elem is channel:
+                record = self.__channel(elem)
+                elem.clear()
+        if record is None:
+            raise TypeError("Missing RSS channel element")
+        return record, episodes
+
+    def __episode(self, etree, known):
+        # a single pass over the item's children is considerably faster
+        # than separate find() calls, especially with lxml
+        children = {}
+        values = []
+        for child in etree:
+            # lxml comments and processing instructions have no string
+            # tag, and their reprs differ between processes
+            if not isinstance(child.tag, str):
+                continue
+            values.append((child.tag, child.text, *child.attrib.items()))
+            if child.tag != "enclosure" or child.get("url") is not None:
+                children.setdefault(child.tag, child)
+        # hashing the raw item is much cheaper than extracting its data;
+        # unlike hash(), digests are stable across processes, so they
+        # remain valid when feeds are restored from the persistent cache
+        digest = hashlib.blake2b(repr(values).encode(), digest_size=8).digest()
         try:
-            timestamp = email.utils.mktime_tz(email.utils.parsedate_tz(text))
-        except AttributeError:
+            return known[digest]
+        except KeyError:
+            pass
+        try:
+            url = get_url(children["enclosure"])
+        except KeyError:
             return None
-        except TypeError:
+        guid = self.__text(children, "guid") or url
+        timestamp = self.__timestamp(children)
+        return self.Episode(
+            guid=guid,
+            uri=self.getitemuri(guid),
+            url=url,
+            title=self.__text(children, "title"),
+            date=self.__date(timestamp),
+            length=self.__length(children),
+            image=self.__image(children),
+            author=self.__text(children, self.ITUNES_PREFIX + "author"),
+            comment=self.__compress(self.__text(children, "description")),
+            timestamp=timestamp,
+            digest=digest,
+        )
+
+    @classmethod
+    def __channel(cls, etree):
+        children = {}
+        for child in etree:
+            children.setdefault(child.tag, child)
+        return cls.Channel(
+            title=cls.__text(children, "title"),
+            author=cls.__text(children, cls.ITUNES_PREFIX + "author"),
+            genre=cls.__genre(children),
+            image=cls.__image(children),
+        )
+
+    @classmethod
+    def __date(cls, timestamp):
+        if timestamp is None:
             return None
         else:
             return (
@@ -153,28 +486,24 @@ class RssFeed(PodcastFeed):
             )
 
     @classmethod
-    def __genre(cls, etree):
-        elem = etree.find(cls.ITUNES_PREFIX + "category")
+    def __genre(cls, children):
+        elem = children.get(cls.ITUNES_PREFIX + "category")
         if elem is not None:
             return elem.get("text")
         else:
             return None
 
     @classmethod
-    def __guid(cls, etree):
-        return etree.findtext("guid") or get_url(etree.find("enclosure"))
-
-    @classmethod
-    def __image(cls, etree):
-        elem = etree.find(cls.ITUNES_PREFIX + "image")
-        if elem is not None:
+    def __image(cls, children):
+        elem = children.get(cls.ITUNES_PREFIX + "image")
+        if elem is not None and elem.get("href"):
             return models.Image(uri=elem.get("href"))
         else:
             return None
 
     @classmethod
-    def __length(cls, etree):
-        text = etree.findtext(cls.ITUNES_PREFIX + "duration")
+    def __length(cls, children):
+        text = cls.__text(children, cls.ITUNES_PREFIX + "duration")
         try:
             groups = cls.DURATION_RE.match(text).groupdict("0")
         except AttributeError:
@@ -185,17 +514,28 @@ class RssFeed(PodcastFeed):
             d = datetime.timedelta(**{k: int(v) for k, v in groups.items()})
             return int(d.total_seconds() * 1000)
 
-    @staticmethod
-    def __order(etree):
-        text = etree.findtext("pubDate")
+    @classmethod
+    def __text(cls, children, tag):
+        # same as findtext(), i.e. "" for empty elements
+        elem = children.get(tag)
+        if elem is not None:
+            return elem.text or ""
+        else:
+            return None
+
+    @classmethod
+    def __timestamp(cls, children):
+        text = cls.__text(children, "pubDate")
         try:
-            timestamp = email.utils.mktime_tz(email.utils.parsedate_tz(text))
+            return email.utils.mktime_tz(email.utils.parsedate_tz(text))
         except AttributeError:
-            return 0
+            return None
         except TypeError:
-            return 0
-        else:
-            return timestamp
+            return None
+
+    @staticmethod
+    def __order(episode):
+        return episode.timestamp or 0
 
 
 class OpmlFeed(PodcastFeed):  # not really a "feed"
@@ -219,42 +559,138 @@ class OpmlFeed(PodcastFeed):  # not really a "feed"
         ),
     }
 
-    def __init__(self, url, root):
+    def __init__(self, url, events):
         super().__init__(url)
-        self.__outlines = root.findall("./body//outline[@type]")
+        self.__refs = list(self.__parse(events))
 
-    def items(self, newest_first=None):
-        for e in self.__outlines:
-            try:
-                ref = self.TYPES[e.get("type").lower()]
-            except KeyError:
-                pass
-            else:
-                yield ref(e)
+    def items(self, newest_first=None, period=None, limit=None):
+        return iter(self.__refs[:limit])
+
+    @classmethod
+    def __parse(cls, events):
+        # outline attributes are available with "start" events
+        body = None
+        for event, elem in events:
+            if event == "end":
+                if elem is body:
+                    body = None
+                elem.clear()
+            elif body is None:
+                if elem.tag == "body":
+                    body = elem
+            elif elem.tag == "outline" and elem.get("type"):
+                try:
+                    ref = cls.TYPES[elem.get("type").lower()]
+                except KeyError:
+                    pass
+                else:
+                    yield ref(elem)
 
 
 if __name__ == "__main__":  # pragma: no cover
     import argparse
     import contextlib
+    import cProfile
     import json
-    import urllib.request
-    import sys
+    import os
+    import pstats
+    import tracemalloc
 
     from mopidy.models import ModelJSONEncoder
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument("url", metavar="URL")
+    parser = argparse.ArgumentParser(
+        description="Dump or profile podcast feeds.",
+        epilog="If more than one URL or any of the profiling options is "
+        "given, report download, parse and processing times instead of "
+        "dumping JSON.",
+    )
+    parser.add_argument("urls", metavar="URL", nargs="+", help="URL or path")
     parser.add_argument("-i", "--images", action="store_true")
     parser.add_argument("-t", "--tracks", action="store_true")
+    parser.add_argument("-e", "--engine", choices=sorted(ENGINES))
+    parser.add_argument(
+        "-p", "--profile", action="store_true", help="report timing and memory"
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="FILE",
+        help="save cProfile statistics to FILE, or print them if FILE is -",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        metavar="N",
+        type=int,
+        help="show the top N allocation sites while parsing",
+    )
     args = parser.parse_args()
+    # the profiling options imply --profile
+    profile = args.profile or args.cprofile or args.tracemalloc is not None
+    engine = args.engine or "stdlib"
+    opener = Extension.get_url_opener({"proxy": {}})
+    profiler = cProfile.Profile() if args.cprofile else None
+
+    def timed(func, *args):
+        start = time.perf_counter()
+        if profiler:
+            result = profiler.runcall(func, *args)
+        else:
+            result = func(*args)
+        return result, time.perf_counter() - start
+
+    def download(url):
+        if os.path.exists(url):
+            url = uritools.uricompose("file", "", os.path.abspath(url))
+        with contextlib.closing(opener.open(url)) as source:
+            return source.read(), source.geturl()
+
+    def kib(size):
+        return size / 1024
+
+    if len(args.urls) == 1 and not profile:
+        data, url = download(args.urls[0])
+        feed = fromstring(data, url, engine=engine)
+        if args.tracks:
+            result = list(feed.tracks())
+        elif args.images:
+            result = dict(feed.images())
+        else:
+            result = list(feed.items())
+        json.dump(result, sys.stdout, cls=ModelJSONEncoder, indent=2)
+        sys.stdout.write("\n")
+        sys.exit()
 
-    with contextlib.closing(urllib.request.urlopen(args.url)) as source:
-        feed = parse(source)
-    if args.tracks:
-        result = list(feed.tracks())
-    elif args.images:
-        result = dict(feed.images())
-    else:
-        result = list(feed.items())
-    json.dump(result, sys.stdout, cls=ModelJSONEncoder, indent=2)
-    sys.stdout.write("\n")
+    for url in args.urls:
+        print(url)
+        try:
+            (data, url), seconds = timed(download, url)
+            print(f"  download {seconds:9.3f}s  {len(data)} bytes")
+            feed, seconds = timed(fromstring, data, url, None, engine)
+            print(f"  parse    {seconds:9.3f}s  {type(feed).__name__}")
+        except Exception as e:
+            print(f"  error: {e}")
+            continue
+        for name in ("items", "tracks", "images"):
+            result, seconds = timed(lambda f=getattr(feed, name): list(f()))
+            print(f"  {name:8} {seconds:9.3f}s  {len(result)} {name}")
+        # measure memory separately, since tracing slows down parsing
+        del feed
+        tracemalloc.start(25 if args.tracemalloc else 1)
+        try:
+            feed = fromstring(data, url, None, engine)
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        print(
+            f"  memory   peak {kib(peak):.1f} KiB, "
+            f"feed {kib(current):.1f} KiB "
+            f"(estimated {kib(feed.getsize()):.1f} KiB)"
+        )
+        for stat in snapshot.statistics("lineno")[: args.tracemalloc or 0]:
+            print(f"    {stat}")
+        del feed
+
+    if profiler and args.cprofile == "-":
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    elif profiler:
+        profiler.dump_stats(args.cprofile)
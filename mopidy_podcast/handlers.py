@@ -0,0 +1,246 @@
+import collections
+import http.client
+import io
+import logging
+import socket
+import threading
+import urllib.error
+import urllib.request
+import urllib.response
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class DecodingReader(io.RawIOBase):
+    """Decompress a gzip or deflate encoded response while reading."""
+
+    CHUNK_SIZE = 64 * 1024
+
+    WBITS = {
+        "deflate": zlib.MAX_WBITS,
+        "gzip": zlib.MAX_WBITS | 16,
+        "x-gzip": zlib.MAX_WBITS | 16,
+    }
+
+    def __init__(self, fp, encoding):
+        self.__fp = fp
+        self.__wbits = self.WBITS[encoding]
+        self.__zlib = zlib.decompressobj(self.__wbits)
+        self.__started = False
+        self.count = 0  # number of encoded bytes read
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.__zlib.eof:
+            data = self.__zlib.unconsumed_tail
+            if not data:
+                data = self.__read()
+            if not data:
+                break
+            chunk = self.__decompress(data, len(b))
+            if chunk:
+                b[: len(chunk)] = chunk
+                return len(chunk)
+        # consume trailing data so the connection can be reused
+        while self.__read():
+            pass
+        return 0
+
+    def close(self):
+        if not self.closed:
+            self.__fp.close()
+        super().close()
+
+    def __read(self):
+        data = self.__fp.read(self.CHUNK_SIZE)
+        self.count += len(data)
+        return data
+
+    def __decompress(self, data, size):
+        try:
+            chunk = self.__zlib.decompress(data, size)
+        except zlib.error:
+            if self.__started or self.__wbits != zlib.MAX_WBITS:
+                raise
+            # some servers send raw deflate data without zlib header
+            self.__wbits = -zlib.MAX_WBITS
+            self.__zlib = zlib.decompressobj(self.__wbits)
+            chunk = self.__zlib.decompress(data, size)
+        self.__started = True
+        return chunk
+
+
+class ContentEncodingHandler(urllib.request.BaseHandler):
+    """Request compressed responses and decode them transparently."""
+
+    def http_request(self, req):
+        if not req.has_header("Accept-encoding"):
+            encodings = ", ".join(sorted(set(DecodingReader.WBITS)))
+            req.add_unredirected_header("Accept-Encoding", encodings)
+        return req
+
+    def http_response(self, req, response):
+        encoding = response.headers.get("Content-Encoding", "")
+        encoding = encoding.strip().lower()
+        if encoding not in DecodingReader.WBITS:
+            return response
+        decoder = DecodingReader(response, encoding)
+        result = urllib.response.addinfourl(
+            io.BufferedReader(decoder),
+            response.headers,
+            response.url,
+            response.status,
+        )
+        result.msg = response.msg
+        result.decoder = decoder
+        return result
+
+    https_request = http_request
+    https_response = http_response
+
+
+class RedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Keep the request method for redirected HEAD requests."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        request = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if request is not None and req.get_method() == "HEAD":
+            request.method = "HEAD"
+        return request
+
+
+class PooledHTTPResponse(http.client.HTTPResponse):
+
+    release = None
+
+    def close(self):
+        # connections can only be reused if the body was read completely
+        reusable = not self.will_close and (self.isclosed() or self.length == 0)
+        super().close()
+        if self.release:
+            release, self.release = self.release, None
+            release(reusable)
+
+
+class ConnectionPool:
+    """Idle keep-alive connections, grouped by host."""
+
+    def __init__(self, maxsize):
+        self.__maxsize = maxsize
+        self.__lock = threading.Lock()
+        self.__idle = collections.defaultdict(list)
+
+    def get(self, key):
+        with self.__lock:
+            try:
+                return self.__idle[key].pop()
+            except IndexError:
+                return None
+
+    def put(self, key, conn):
+        with self.__lock:
+            idle = self.__idle[key]
+            if len(idle) < self.__maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self.__lock:
+            conns = [conn for idle in self.__idle.values() for conn in idle]
+            self.__idle.clear()
+        for conn in conns:
+            conn.close()
+
+
+class KeepAliveMixin:
+    """Reuse persistent connections for requests to the same host."""
+
+    def __init__(self, *args, maxsize=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__pool = ConnectionPool(maxsize)
+
+    def close(self):
+        self.__pool.clear()
+
+    def do_open(self, http_class, req, **kwargs):
+        if not req.host:
+            raise urllib.error.URLError("no host given")
+        key = (http_class, req.host, req._tunnel_host)
+        conn = self.__pool.get(key)
+        if conn is not None:
+            try:
+                return self.__request(key, conn, req)
+            except (ConnectionError, http.client.HTTPException) as e:
+                # the server may have closed an idle connection
+                logger.debug("Cannot reuse connection to %s: %s", key[1], e)
+                conn.close()
+            except OSError as e:
+                conn.close()
+                raise urllib.error.URLError(e)
+            except Exception:
+                conn.close()
+                raise
+        conn = http_class(req.host, timeout=req.timeout, **kwargs)
+        conn.set_debuglevel(self._debuglevel)
+        conn.response_class = PooledHTTPResponse
+        try:
+            return self.__request(key, conn, req)
+        except OSError as e:
+            conn.close()
+            raise urllib.error.URLError(e)
+        except Exception:
+            conn.close()
+            raise
+
+    def __request(self, key, conn, req):
+        headers = dict(req.unredirected_hdrs)
+        headers.update(
+            {k: v for k, v in req.headers.items() if k not in headers}
+        )
+        headers["Connection"] = "keep-alive"
+        headers = {name.title(): val for name, val in headers.items()}
+        if req._tunnel_host:
+            tunnel_headers = {}
+            if "Proxy-Authorization" in headers:
+                tunnel_headers["Proxy-Authorization"] = headers.pop(
+                    "Proxy-Authorization"
+                )
+            if conn.sock is None:
+                conn.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+        if conn.sock is not None:
+            timeout = req.timeout
+            if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                # as with new connections, use the global default timeout
+                timeout = socket.getdefaulttimeout()
+            conn.sock.settimeout(timeout)
+        conn.timeout = req.timeout
+        conn.request(
+            req.get_method(),
+            req.selector,
+            req.data,
+            headers,
+            encode_chunked=req.has_header("Transfer-encoding"),
+        )
+        response = conn.getresponse()
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        response.release = lambda reusable: self.__release(key, conn, reusable)
+        return response
+
+    def __release(self, key, conn, reusable):
+        if reusable:
+            self.__pool.put(key, conn)
+        else:
+            conn.close()
+
+
+class HTTPHandler(KeepAliveMixin, urllib.request.HTTPHandler):
+    pass
+
+
+class HTTPSHandler(KeepAliveMixin, urllib.request.HTTPSHandler):
+    pass
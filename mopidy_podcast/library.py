@@ -1,15 +1,21 @@
+import collections
+import heapq
 import itertools
 import locale
 import logging
+import operator
 import os
 
 import uritools
 from mopidy import backend, models
 
 from . import Extension
+from .metrics import timed
 
 logger = logging.getLogger(__name__)
 
+LATEST_URI = "podcast:latest"
+
 
 def strerror(error):
     if isinstance(error.strerror, bytes):
@@ -40,8 +46,11 @@ class PodcastLibraryProvider(backend.LibraryProvider):
         self.__config_dir = get_config_dir(config)
         self.__browse_root = config[Extension.ext_name]["browse_root"]
         self.__browse_order = config[Extension.ext_name]["browse_order"]
+        self.__browse_limit = config[Extension.ext_name]["browse_limit"]
+        self.__latest_limit = config[Extension.ext_name]["latest_limit"]
         self.__lookup_order = config[Extension.ext_name]["lookup_order"]
-        self.__tracks = {}  # cache tracks for faster lookup
+        self.__comment_limit = config[Extension.ext_name]["comment_limit"]
+        self.__search_limit = config[Extension.ext_name]["search_limit"]
 
     @property
     def root_directory(self):
@@ -62,60 +71,141 @@ class PodcastLibraryProvider(backend.LibraryProvider):
             logger.error("Cannot retrieve Podcast root directory")
             return None
 
+    @timed("library.browse")
     def browse(self, uri):
+        if uri == LATEST_URI:
+            _, refs = self.__latest()
+            return refs
         try:
-            feed = self.backend.feeds[uri]
+            feeduri, period = self.__parse(uri)
+            feed = self.backend.feeds.load(feeduri)
         except Exception as e:
             logger.error("Error retrieving %s: %s", uri, e)  # TODO: raise?
         else:
-            return list(feed.items(self.__browse_order == "desc"))
+            refs = self.__browse(feed, period)
+            root = self.root_directory
+            if self.__latest_limit and root and uri == root.uri:
+                latest = models.Ref.directory(
+                    name="Latest Episodes", uri=LATEST_URI
+                )
+                refs.insert(0, latest)
+            return refs
         return []  # FIXME: hide errors from clients
 
+    @timed("library.get_images")
     def get_images(self, uris):
-        def key(uri):
-            return uritools.uridefrag(uri).uri
-
+        groups = collections.defaultdict(list)
+        for uri in uris:
+            if not uri.startswith("podcast:"):
+                groups[uritools.uridefrag(uri).uri].append(uri)
+        feeds = self.backend.feeds.getmany(groups)
         result = {}
-        for feeduri, urls in itertools.groupby(sorted(uris, key=key), key=key):
-            try:
-                images = dict(self.backend.feeds[feeduri].images())
-            except Exception as e:
-                logger.error("Error retrieving images for %s: %s", feeduri, e)
-            else:
-                result.update((url, images.get(url, [])) for url in urls)
+        for feeduri, urls in groups.items():
+            if feeduri in feeds:
+                feed = feeds[feeduri]
+                result.update((url, feed.getimages(url)) for url in urls)
         return result
 
+    @timed("library.lookup")
     def lookup(self, uri):
-        # pop from __tracks since cached tracks shouldn't live too long
+        if uri == LATEST_URI:
+            feeds, refs = self.__latest()
+            return [
+                feeds[uritools.uridefrag(ref.uri).uri].gettrack(
+                    ref.uri, self.__comment_limit
+                )
+                for ref in refs
+            ]
         try:
-            track = self.__tracks.pop(uri)
-        except KeyError:
-            logger.debug("Lookup cache miss: %s", uri)
-        else:
-            return [track]
-        try:
-            feed = self.backend.feeds[uritools.uridefrag(uri).uri]
+            feeduri, period = self.__parse(uritools.uridefrag(uri).uri)
+            feed = self.backend.feeds.load(feeduri)
         except Exception as e:
             logger.error("Error retrieving %s: %s", uri, e)  # TODO: raise?
         else:
-            return self.__lookup(feed, uri)
+            tracks = self.__lookup(feed, uri, period)
+            # only warm episodes looked up individually, which are
+            # usually added to the tracklist for playing next
+            fragment = uritools.urisplit(uri).fragment
+            if tracks and fragment and self.backend.resolver:
+                self.__warm(feed, tracks)
+            return tracks
         return []  # FIXME: hide errors from clients
 
+    @timed("library.search")
+    def search(self, query=None, uris=None, exact=False):
+        tracks = self.backend.feeds.index.search(
+            query or {}, uris, exact, self.__search_limit
+        )
+        return models.SearchResult(uri="podcast:search", tracks=tracks)
+
+    @timed("library.refresh")
     def refresh(self, uri=None):
         if uri:
-            self.backend.feeds.pop(uritools.uridefrag(uri).uri, None)
+            self.backend.feeds.invalidate(uritools.uridefrag(uri).uri)
         else:
-            self.backend.feeds.clear()
-        self.__tracks.clear()
-
-    def __lookup(self, feed, uri):
-        if uri == feed.uri:
-            return list(feed.tracks(self.__lookup_order == "desc"))
+            self.backend.feeds.invalidate()
+
+    def __browse(self, feed, period=None):
+        newest_first = self.__browse_order == "desc"
+        limit = self.__browse_limit
+        periods = list(feed.periods(period)) if limit else []
+        if sum(count for _, count in periods) <= (limit or 0):
+            return list(feed.items(newest_first, period))
+        # show latest episodes, followed by older episodes grouped by period
+        refs = list(feed.items(newest_first, period, limit))
+        for key, _ in reversed(periods) if newest_first else periods:
+            uri = uritools.uricompose(
+                "podcast",
+                path="archive",
+                query=[("uri", feed.uri), ("period", key)],
+            )
+            name = "Undated" if key == feed.UNDATED else key
+            refs.append(models.Ref.directory(name=name, uri=uri))
+        return refs
+
+    def __lookup(self, feed, uri, period=None):
+        newest_first = self.__lookup_order == "desc"
+        if period:
+            tracks = feed.tracks(newest_first, period, self.__comment_limit)
+            return list(tracks)
+        elif uri == feed.uri:
+            return list(feed.tracks(newest_first, None, self.__comment_limit))
         else:
-            self.__tracks = tracks = {t.uri: t for t in feed.tracks()}
-            try:
-                track = tracks.pop(uri)
-            except KeyError:
+            track = feed.gettrack(uri, self.__comment_limit)
+            if track is None:
                 logger.warning("No such track: %s", uri)  # TODO: raise?
             else:
                 return [track]
+
+    def __latest(self):
+        # merge episodes lazily, so only the newest ones are processed
+        root = self.root_directory
+        if not self.__latest_limit or not root:
+            return {}, []
+        uris = [
+            ref.uri
+            for ref in self.backend.feeds.subscriptions(root.uri)
+            if ref.type == models.Ref.ALBUM
+        ]
+        feeds = {f.uri: f for f in self.backend.feeds.getmany(uris).values()}
+        merged = heapq.merge(
+            *(feed.latest() for feed in feeds.values()),
+            key=operator.itemgetter(0),
+            reverse=True,
+        )
+        refs = [ref for _, ref in itertools.islice(merged, self.__latest_limit)]
+        return feeds, refs
+
+    def __warm(self, feed, tracks):
+        guids = (uritools.uridefrag(t.uri).getfragment() for t in tracks)
+        urls = (feed.getstreamuri(guid) for guid in guids)
+        self.backend.resolver.warm(url for url in urls if url)
+
+    @staticmethod
+    def __parse(uri):
+        parts = uritools.urisplit(uri)
+        if parts.scheme == "podcast" and parts.path == "archive":
+            query = parts.getquerydict()
+            return query["uri"][0], query["period"][0]
+        else:
+            return uri, None
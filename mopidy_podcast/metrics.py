@@ -0,0 +1,131 @@
+import bisect
+import collections
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+
+class Histogram:
+    """Distribution of observed values, e.g. durations in seconds."""
+
+    BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+
+    def todict(self):
+        labels = [f"<={bound}" for bound in self.BOUNDS] + ["inf"]
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class Metrics:
+    """Thread-safe counters and histograms.
+
+    Values recorded for a `key`, such as a host name, are also added
+    to the totals for all keys.
+
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters = collections.Counter()
+        self.__histograms = collections.defaultdict(Histogram)
+
+    def count(self, name, key=None, value=1):
+        """Increment counter `name` by `value`."""
+        with self.__lock:
+            self.__counters[name, None] += value
+            if key is not None:
+                self.__counters[name, key] += value
+
+    def observe(self, name, value, key=None):
+        """Add `value` to histogram `name`."""
+        with self.__lock:
+            self.__histograms[name, None].add(value)
+            if key is not None:
+                self.__histograms[name, key].add(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, key=None):
+        """Context manager for adding the time spent in its body to
+        histogram `name`."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, key)
+
+    def keys(self):
+        """Return the keys metrics have been recorded for."""
+        with self.__lock:
+            keys = {key for _, key in self.__counters}
+            keys.update(key for _, key in self.__histograms)
+        keys.discard(None)
+        return sorted(keys)
+
+    def stats(self, key=None):
+        """Return a dict mapping metric names to counter values or
+        histogram summaries for `key`, or totals if `key` is `None`."""
+        with self.__lock:
+            result = {n: v for (n, k), v in self.__counters.items() if k == key}
+            for (name, k), histogram in self.__histograms.items():
+                if k == key:
+                    result[name] = histogram.todict()
+        return dict(sorted(result.items()))
+
+    def clear(self):
+        with self.__lock:
+            self.__counters.clear()
+            self.__histograms.clear()
+
+    def log(self, logger, level=logging.DEBUG):
+        """Log a summary of all metrics."""
+        if not logger.isEnabledFor(level):
+            return
+        for key in [None] + self.keys():
+            for name, value in self.stats(key).items():
+                if isinstance(value, dict):
+                    value = "count=%d mean=%.3f max=%.3f" % (
+                        value["count"],
+                        value["mean"],
+                        value["max"],
+                    )
+                logger.log(level, "%s[%s]: %s", name, key or "total", value)
+
+
+def timed(name):
+    """Decorator for recording the duration of provider method calls."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.backend.feeds.metrics.timer(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -3,15 +3,22 @@ import logging
 import uritools
 from mopidy import backend
 
+from .metrics import timed
+
 logger = logging.getLogger(__name__)
 
 
 class PodcastPlaybackProvider(backend.PlaybackProvider):
+    @timed("playback.translate_uri")
     def translate_uri(self, uri):
         parts = uritools.uridefrag(uri)
         try:
-            feed = self.backend.feeds[parts.uri]
+            feed = self.backend.feeds.load(parts.uri)
         except Exception as e:
             logger.error("Error retrieving %s: %s", parts.uri, e)
         else:
-            return feed.getstreamuri(parts.getfragment())
+            url = feed.getstreamuri(parts.getfragment())
+            if url and self.backend.resolver:
+                return self.backend.resolver.resolve(url)
+            else:
+                return url
@@ -0,0 +1,92 @@
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import uritools
+
+logger = logging.getLogger(__name__)
+
+
+class PodcastFeedRefresher:
+    """Periodically retrieve all feeds referenced by the browse root.
+
+    All directories, including remote ones, are traversed
+    recursively, while remote feeds and directories are refreshed in a
+    thread pool, with the number of concurrent requests per host
+    limited to `host_limit`.
+
+    """
+
+    def __init__(self, feeds, root, interval, workers=4, host_limit=2):
+        self.__feeds = feeds
+        self.__root = root
+        self.__interval = interval
+        self.__host_limit = host_limit
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="PodcastFeedRefresher"
+        )
+        self.__semaphores = collections.defaultdict(
+            lambda: threading.BoundedSemaphore(self.__host_limit)
+        )
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(
+            target=self.__run, name="PodcastFeedRefresher", daemon=True
+        )
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__executor.shutdown(wait=False)
+
+    def refresh(self, revalidate=True):
+        start = time.monotonic()
+        futures = [
+            self.__executor.submit(self.__refresh, uri, revalidate)
+            for uri in self.__subscriptions()
+        ]
+        concurrent.futures.wait(futures)
+        logger.debug(
+            "Refreshed %d podcast feeds in %.3fs",
+            len(futures),
+            time.monotonic() - start,
+        )
+        self.__feeds.metrics.log(logger)
+
+    def __run(self):
+        # initially, fill the cache from any up-to-date persistent copies
+        revalidate = False
+        while not self.__stopped.is_set():
+            try:
+                self.refresh(revalidate)
+            except Exception as e:
+                if not self.__stopped.is_set():
+                    logger.warning("Error refreshing podcast feeds: %s", e)
+            revalidate = True
+            self.__stopped.wait(self.__interval)
+
+    def __refresh(self, uri, revalidate):
+        if self.__stopped.is_set():
+            return
+        with self.__lock:
+            semaphore = self.__semaphores[uritools.urisplit(uri).gethost()]
+        with semaphore:
+            try:
+                self.__feeds.fetch(uri, revalidate)
+            except Exception as e:
+                logger.warning("Error refreshing %s: %s", uri, e)
+
+    def __subscriptions(self):
+        # local feeds and directories are validated on access
+        uris = [
+            ref.uri
+            for ref in self.__feeds.subscriptions(self.__root)
+            if not ref.uri.startswith("podcast+file:")
+        ]
+        if not self.__root.startswith("podcast+file:"):
+            uris.insert(0, self.__root)
+        return uris
@@ -0,0 +1,85 @@
+import concurrent.futures
+import itertools
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+import cachetools
+
+logger = logging.getLogger(__name__)
+
+
+class RedirectResolver:
+    """Resolve and cache the final URLs of redirected episode streams.
+
+    Many podcast enclosures point to tracking services which redirect
+    to the actual media file.  Resolving these ahead of time spares the
+    audio layer the extra round trips when playback starts.
+
+    """
+
+    MAXSIZE = 1024
+
+    WARM_LIMIT = 10
+
+    def __init__(self, opener, ttl, timeout=None, workers=2):
+        self.__opener = opener
+        self.__timeout = timeout
+        self.__cache = cachetools.TTLCache(maxsize=self.MAXSIZE, ttl=ttl)
+        self.__lock = threading.RLock()
+        self.__pending = {}
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="PodcastRedirectResolver"
+        )
+
+    def resolve(self, url):
+        """Return the final URL for `url`, following any redirects."""
+        with self.__lock:
+            try:
+                return self.__cache[url]
+            except KeyError:
+                future = self.__pending.get(url)
+        if future is not None:
+            return future.result()
+        else:
+            return self.__resolve(url)
+
+    def warm(self, urls):
+        """Resolve the first `WARM_LIMIT` URLs in the background."""
+        with self.__lock:
+            for url in itertools.islice(urls, self.WARM_LIMIT):
+                if url in self.__cache or url in self.__pending:
+                    continue
+                future = self.__executor.submit(self.__resolve, url)
+                self.__pending[url] = future
+                future.add_done_callback(self.__done(url))
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
+
+    def __done(self, url):
+        def done(future):
+            with self.__lock:
+                self.__pending.pop(url, None)
+
+        return done
+
+    def __resolve(self, url):
+        request = urllib.request.Request(url, method="HEAD")
+        try:
+            with self.__opener.open(request, timeout=self.__timeout) as f:
+                result = f.geturl()
+        except urllib.error.HTTPError as e:
+            # servers may not support HEAD requests; do not retry
+            logger.debug("Cannot resolve %s: %s", url, e)
+            e.close()
+            result = url
+        except Exception as e:
+            logger.warning("Error resolving %s: %s", url, e)
+            return url
+        if result != url:
+            logger.debug("Resolved %s to %s", url, result)
+        with self.__lock:
+            self.__cache[url] = result
+        return result
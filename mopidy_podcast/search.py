@@ -0,0 +1,169 @@
+import bisect
+import collections
+import re
+import sys
+import threading
+
+TAG_RE = re.compile(r"<[^>]*>")
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(TAG_RE.sub(" ", text).casefold()) if text else []
+
+
+class PodcastSearchIndex:
+    """Inverted index of podcast episodes.
+
+    For every search field, tokens are mapped to the URIs of matching
+    episodes, grouped by feed so that feeds can be added and removed
+    without scanning the whole index.  Feeds are keyed by the URI they
+    were requested with, which may differ from the feed's own URI if
+    the request was redirected.
+
+    """
+
+    FIELDS = {
+        "track_name": lambda t: [t.name],
+        "album": lambda t: [t.album.name] if t.album else [],
+        "artist": lambda t: [a.name for a in t.artists],
+        "albumartist": lambda t: (
+            [a.name for a in t.album.artists] if t.album else []
+        ),
+        "comment": lambda t: [t.comment],
+    }
+
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__feeds = {}  # requested URI -> (feed, (field, token) set)
+        self.__index = {field: {} for field in self.FIELDS}
+        self.__tokens = {field: [] for field in self.FIELDS}  # sorted
+
+    def __contains__(self, uri):
+        return uri in self.__feeds
+
+    def add(self, uri, feed):
+        """Add or replace `feed`, requested as `uri`, and return the
+        approximate memory footprint of its postings in bytes."""
+        postings = collections.defaultdict(set)
+        for track in feed.tracks():
+            for field, getter in self.FIELDS.items():
+                for text in getter(track):
+                    for token in tokenize(text):
+                        postings[field, token].add(track.uri)
+        # tuples take a fraction of the memory of sets
+        postings = {key: tuple(uris) for key, uris in postings.items()}
+        keys = set(postings)
+        size = sys.getsizeof(keys)
+        for key, uris in postings.items():
+            # key, token, posting list and the feed's entry for the token
+            size += sys.getsizeof(key) + sys.getsizeof(key[1])
+            size += sys.getsizeof(uris) + sys.getsizeof({uri: uris})
+        with self.__lock:
+            self.__remove(uri)
+            for (field, token), uris in postings.items():
+                index = self.__index[field]
+                if token not in index:
+                    bisect.insort(self.__tokens[field], token)
+                    index[token] = {}
+                index[token][uri] = uris
+            self.__feeds[uri] = (feed, keys)
+        return size
+
+    def remove(self, uri):
+        with self.__lock:
+            self.__remove(uri)
+
+    def clear(self):
+        with self.__lock:
+            self.__feeds.clear()
+            for field in self.FIELDS:
+                self.__index[field].clear()
+                self.__tokens[field].clear()
+
+    def search(self, query, uris=None, exact=False, limit=None):
+        with self.__lock:
+            feeds = {uri: feed for uri, (feed, _) in self.__feeds.items()}
+            # only the backend's root URI stands for all podcasts
+            if uris and "podcast:" not in uris:
+                uris = set(uris)
+                feeds = {
+                    uri: feed
+                    for uri, feed in feeds.items()
+                    if uri in uris or feed.uri in uris
+                }
+            result = None
+            for field, values in query.items():
+                for value in values:
+                    matches = self.__match(field, value, exact, feeds)
+                    result = matches if result is None else result & matches
+        # episode URIs are based on the feeds' own URIs
+        feeds = {feed.uri: feed for feed in feeds.values()}
+        matches = [(uri, feeds[uri.partition("#")[0]]) for uri in result or ()]
+        # only build tracks for the newest matches that are returned
+        matches.sort(key=lambda m: m[1].gettimestamp(m[0]) or 0, reverse=True)
+        tracks = []
+        for uri, feed in matches:
+            if limit is not None and len(tracks) >= limit:
+                break
+            track = feed.gettrack(uri)
+            if not exact or self.__equals(track, query):
+                tracks.append(track)
+        return tracks
+
+    def __match(self, field, value, exact, feeds):
+        if field == "any":
+            fields = self.FIELDS
+        elif field in self.FIELDS:
+            fields = [field]
+        else:
+            return set()
+        result = None
+        for token in tokenize(value):
+            uris = set()
+            for name in fields:
+                index = self.__index[name]
+                for key in self.__expand(name, token, exact):
+                    for feeduri, items in index[key].items():
+                        if feeduri in feeds:
+                            uris.update(items)
+            result = uris if result is None else result & uris
+        return result or set()
+
+    def __expand(self, field, token, exact):
+        if exact:
+            return [token] if token in self.__index[field] else []
+        tokens = self.__tokens[field]
+        start = bisect.bisect_left(tokens, token)
+        stop = bisect.bisect_left(tokens, token + "\uffff", start)
+        return tokens[start:stop]
+
+    def __equals(self, track, query):
+        for field, values in query.items():
+            if field == "any":
+                getters = self.FIELDS.values()
+            else:
+                getters = [self.FIELDS[field]]
+            texts = {
+                text.casefold()
+                for getter in getters
+                for text in getter(track)
+                if text
+            }
+            if not all(value.casefold() in texts for value in values):
+                return False
+        return True
+
+    def __remove(self, uri):
+        try:
+            _, postings = self.__feeds.pop(uri)
+        except KeyError:
+            return
+        for field, token in postings:
+            feeds = self.__index[field][token]
+            del feeds[uri]
+            if not feeds:
+                del self.__index[field][token]
+                tokens = self.__tokens[field]
+                del tokens[bisect.bisect_left(tokens, token)]
@@ -0,0 +1,152 @@
+import collections
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FeedStore:
+    """Persistent storage for parsed podcast feeds.
+
+    Each feed is pickled to a separate file, together with the HTTP
+    validators needed for conditional requests.  The file's
+    modification time is used as the time the feed was last known to
+    be up-to-date.
+
+    Files are replaced atomically, so the same directory may be shared
+    by multiple processes, which can use :meth:`lock` to coordinate
+    updates.
+
+    """
+
+    VERSION = 3
+
+    Entry = collections.namedtuple("Entry", "feed etag modified timestamp")
+
+    def __init__(self, path):
+        self.__path = path
+
+    def load(self, uri):
+        path = self.__getpath(uri)
+        try:
+            with open(path, "rb") as f:
+                timestamp = os.fstat(f.fileno()).st_mtime
+                # unpickle from the page cache instead of copying the file
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    version, key, feed, etag, modified = pickle.loads(m)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Error loading %s from %s: %s", uri, path, e)
+            return None
+        if version != self.VERSION or key != uri:
+            logger.debug("Ignoring outdated cache file %s", path)
+            return None
+        return self.Entry(feed, etag, modified, timestamp)
+
+    def save(self, uri, feed, etag=None, modified=None):
+        data = (self.VERSION, uri, feed, etag, modified)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.__path, suffix=".tmp")
+        except OSError as e:
+            logger.warning("Error saving %s to %s: %s", uri, self.__path, e)
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.__getpath(uri))
+        except Exception as e:
+            logger.warning("Error saving %s to %s: %s", uri, self.__path, e)
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+    @contextlib.contextmanager
+    def lock(self, uri):
+        """Context manager for holding an exclusive lock on `uri` that
+        is shared with other processes.
+
+        Yields whether the lock had to be waited for, i.e. whether the
+        stored feed may have been updated by another process.
+
+        """
+        if fcntl is None:
+            yield False
+            return
+        path = self.__getpath(uri, ".lock")
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        except OSError as e:
+            logger.warning("Error locking %s in %s: %s", uri, self.__path, e)
+            yield False
+            return
+        try:
+            # keep lock files in use from being pruned
+            with contextlib.suppress(OSError):
+                os.utime(path)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.debug("Waiting for %s to be updated", uri)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield True
+            else:
+                yield False
+        finally:
+            os.close(fd)  # also releases the lock
+
+    def touch(self, uri):
+        with contextlib.suppress(OSError):
+            os.utime(self.__getpath(uri))
+
+    def expire(self, uri=None):
+        if uri is None:
+            paths = self.__getpaths()
+        else:
+            paths = [self.__getpath(uri)]
+        for path in paths:
+            with contextlib.suppress(OSError):
+                os.utime(path, (0, 0))
+
+    def prune(self, maxage):
+        """Remove cached feeds, lock files and leftover temporary files
+        that have not been updated for `maxage` seconds."""
+        limit = time.time() - maxage
+        count = 0
+        for path in self.__getpaths((".pickle", ".lock", ".tmp")):
+            try:
+                if os.stat(path).st_mtime < limit:
+                    os.remove(path)
+                    count += 1
+            except OSError as e:
+                logger.debug("Error pruning %s: %s", path, e)
+        if count:
+            logger.debug("Pruned %d files from %s", count, self.__path)
+        return count
+
+    def __getpath(self, uri, suffix=".pickle"):
+        name = hashlib.sha1(uri.encode()).hexdigest()
+        return os.path.join(self.__path, name + suffix)
+
+    def __getpaths(self, suffixes=".pickle"):
+        try:
+            names = os.listdir(self.__path)
+        except OSError as e:
+            logger.warning("Error listing %s: %s", self.__path, e)
+            return []
+        else:
+            return [
+                os.path.join(self.__path, name)
+                for name in names
+                if name.endswith(suffixes)
+            ]
@@ -17,17 +17,37 @@ def audio():
 
 
 @pytest.fixture
-def config():
+def config(tmp_path):
     return {
         "podcast": {
             "browse_root": "Podcasts.opml",
             "browse_order": "desc",
+            "browse_limit": 100,
+            "latest_limit": None,
             "lookup_order": "asc",
+            "comment_limit": None,
+            "search_limit": 100,
             "cache_size": 64,
+            "cache_memory": None,
             "cache_ttl": 86400,
+            "cache_ttl_min": None,
+            "cache_grace": 86400,
+            "cache_persist": True,
+            "cache_dir": None,
             "timeout": 10,
+            "parser": "stdlib",
+            "parser_processes": None,
+            "parser_threshold": 256,
+            "fetch_wait": 5,
+            "refresh_interval": None,
+            "refresh_workers": 4,
+            "refresh_host_limit": 2,
+            "redirect_ttl": None,
+        },
+        "core": {
+            "config_dir": os.path.dirname(__file__),
+            "data_dir": str(tmp_path),
         },
-        "core": {"config_dir": os.path.dirname(__file__)},
         "proxy": {},
     }
 
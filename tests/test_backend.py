@@ -0,0 +1,399 @@
+import os
+import threading
+import time
+import urllib.error
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from mopidy_podcast import Extension, backend
+
+
+class Source(BytesIO):
+    def __init__(self, url, data, headers):
+        super().__init__(data)
+        self.url = url
+        self.headers = headers
+
+    def geturl(self):
+        return self.url
+
+
+@pytest.fixture
+def opener(abspath):
+    with open(abspath("rssfeed.xml"), "rb") as f:
+        data = f.read()
+
+    def open_url(request, timeout=None):
+        url = getattr(request, "full_url", request)
+        return Source(url, data, {"ETag": '"1"'})
+
+    opener = mock.Mock(handlers=[])
+    opener.open.side_effect = open_url
+    with mock.patch.object(Extension, "get_url_opener", return_value=opener):
+        yield opener
+
+
+def test_persistent_cache(config, opener):
+    uri = "podcast+http://example.com/feed.xml"
+    feed = backend.PodcastFeedCache(config).load(uri)
+    assert opener.open.call_count == 1
+    # simulate restart
+    cache = backend.PodcastFeedCache(config)
+    assert list(cache.load(uri).tracks()) == list(feed.tracks())
+    assert opener.open.call_count == 1
+    # force revalidation
+    cache.invalidate(uri)
+    opener.open.side_effect = urllib.error.HTTPError(
+        "http://example.com/feed.xml", 304, "Not Modified", {}, None
+    )
+    assert list(cache.load(uri).tracks()) == list(feed.tracks())
+    assert opener.open.call_count == 2
+    (request,), _ = opener.open.call_args
+    assert request.get_header("If-none-match") == '"1"'
+
+
+def test_persistent_cache_disabled(config, opener):
+    config["podcast"]["cache_persist"] = False
+    uri = "podcast+http://example.com/feed.xml"
+    backend.PodcastFeedCache(config).load(uri)
+    backend.PodcastFeedCache(config).load(uri)
+    assert opener.open.call_count == 2
+
+
+@pytest.fixture
+def slow_opener(opener):
+    opener.started = threading.Event()
+    opener.finish = threading.Event()
+    open_url = opener.open.side_effect
+
+    def wait_and_open(request, timeout=None):
+        opener.started.set()
+        opener.finish.wait()
+        return open_url(request, timeout)
+
+    opener.open.side_effect = wait_and_open
+    return opener
+
+
+def test_fetch_wait(config, slow_opener):
+    config["podcast"]["fetch_wait"] = 0
+    cache = backend.PodcastFeedCache(config)
+    uri = "podcast+http://example.com/feed.xml"
+    with pytest.raises(TimeoutError):
+        cache.load(uri)
+    slow_opener.started.wait()
+    with pytest.raises(TimeoutError):
+        cache.load(uri)
+    slow_opener.finish.set()
+    while uri not in cache:
+        time.sleep(0.01)
+    assert slow_opener.open.call_count == 1
+    cache.close()
+
+
+def test_fetch_error(config, opener):
+    config["podcast"]["cache_persist"] = False
+    uri = "podcast+http://example.com/feed.xml"
+    cache = backend.PodcastFeedCache(config)
+    opener.open.side_effect = urllib.error.URLError("error")
+    with pytest.raises(urllib.error.URLError):
+        cache.load(uri)
+    # fail fast instead of blocking on the same feed again
+    with pytest.raises(urllib.error.URLError):
+        cache.load(uri)
+    assert cache.getmany([uri]) == {}
+    assert opener.open.call_count == 1
+    cache.invalidate(uri)
+    with pytest.raises(urllib.error.URLError):
+        cache.load(uri)
+    assert opener.open.call_count == 2
+
+
+def test_stale_while_revalidate(config, opener):
+    config["podcast"]["cache_ttl"] = 1
+    cache = backend.PodcastFeedCache(config)
+    uri = "podcast+http://example.com/feed.xml"
+    feed = cache.load(uri)
+    time.sleep(1.1)
+    assert cache.load(uri) is feed
+    while opener.open.call_count < 2 or cache.load(uri) is feed:
+        time.sleep(0.01)
+    (request,), _ = opener.open.call_args
+    assert request.get_header("If-none-match") == '"1"'
+    cache.close()
+
+
+def test_stale_on_error(config, opener, tmp_path):
+    config["podcast"]["cache_ttl"] = 60
+    uri = "podcast+http://example.com/feed.xml"
+    feed = backend.PodcastFeedCache(config).load(uri)
+    for path in tmp_path.glob("**/*.pickle"):
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    opener.open.side_effect = urllib.error.URLError("error")
+    cache = backend.PodcastFeedCache(config)
+    assert list(cache.load(uri).tracks()) == list(feed.tracks())
+    assert opener.open.call_count == 2
+    config["podcast"]["cache_grace"] = 0
+    with pytest.raises(urllib.error.URLError):
+        backend.PodcastFeedCache(config).load(uri)
+
+
+def test_getmany(config, opener):
+    cache = backend.PodcastFeedCache(config)
+    uris = [
+        "podcast+http://example.com/feed1.xml",
+        "podcast+http://example.com/feed2.xml",
+    ]
+    feeds = cache.getmany(uris + ["http://example.com/feed.xml"])
+    assert sorted(feeds) == uris
+    assert all(feeds[uri] is cache.load(uri) for uri in uris)
+    assert opener.open.call_count == 2
+
+
+def test_subscriptions(config, opener, abspath):
+    from benchmarks import generate
+
+    with open(abspath("rssfeed.xml"), "rb") as f:
+        rss = f.read()
+    documents = {
+        "http://example.com/root.opml": generate.opml(
+            [
+                ("rss", "a", "http://example.com/a.xml"),
+                ("include", "sub", "http://example.com/sub.opml"),
+            ]
+        ),
+        "http://example.com/sub.opml": generate.opml(
+            [
+                ("rss", "b", "http://example.com/b.xml"),
+                ("include", "root", "http://example.com/root.opml"),
+            ]
+        ),
+    }
+
+    def open_url(request, timeout=None):
+        url = getattr(request, "full_url", request)
+        return Source(url, documents.get(url, rss), {})
+
+    opener.open.side_effect = open_url
+    cache = backend.PodcastFeedCache(config)
+    refs = cache.subscriptions("podcast+http://example.com/root.opml")
+    assert [ref.uri for ref in refs] == [
+        "podcast+http://example.com/a.xml",
+        "podcast+http://example.com/sub.opml",
+        "podcast+http://example.com/b.xml",
+    ]
+
+
+def test_eviction(config, opener):
+    config["podcast"]["cache_persist"] = False
+    config["podcast"]["cache_size"] = 2
+    config["podcast"]["cache_ttl"] = 1
+    config["podcast"]["cache_grace"] = 0
+    cache = backend.PodcastFeedCache(config)
+    uris = [f"podcast+http://example.com/feed{i}.xml" for i in range(3)]
+    for uri in uris:
+        cache.load(uri)
+    assert opener.open.call_count == 3
+    assert len(cache) == 2
+    assert cache.metrics.stats()["cache.evicted"] == 1
+    # expiring must not reload feeds either
+    assert len(cache.expire(time.monotonic() + 2)) == 2
+    assert opener.open.call_count == 3
+    assert "cache.hits" not in cache.metrics.stats()
+
+
+def test_eviction_redirect(config, opener):
+    config["podcast"]["cache_persist"] = False
+    config["podcast"]["cache_size"] = 1
+    open_url = opener.open.side_effect
+
+    def redirect(request, timeout=None):
+        source = open_url(request, timeout)
+        source.url = source.url.replace("http:", "https:")
+        return source
+
+    opener.open.side_effect = redirect
+    cache = backend.PodcastFeedCache(config)
+    uris = [f"podcast+http://example.com/feed{i}.xml" for i in range(2)]
+    assert cache.load(uris[0]).uri == uris[0].replace("http:", "https:")
+    cache.load(uris[1])
+    assert uris[0] not in cache.index
+    assert uris[1] in cache.index
+
+
+def test_cache_memory(config, opener):
+    uris = [
+        "podcast+http://example.com/feed1.xml",
+        "podcast+http://example.com/feed2.xml",
+    ]
+    cache = backend.PodcastFeedCache(config)
+    feed = cache.load(uris[0])
+    (size,) = cache.usage().values()
+    # includes the feed's search index
+    assert size > feed.getsize()
+    assert cache.currsize == 1
+    config["podcast"]["cache_persist"] = False
+    config["podcast"]["cache_memory"] = (size * 3 // 2) // 1024 + 1
+    cache = backend.PodcastFeedCache(config)
+    cache.load(uris[0])
+    assert cache.currsize == sum(cache.usage().values())
+    cache.load(uris[1])
+    assert list(cache.usage()) == [uris[1]]
+    assert cache.currsize == sum(cache.usage().values())
+    assert uris[0] not in cache.index
+    config["podcast"]["cache_memory"] = 1
+    cache = backend.PodcastFeedCache(config)
+    assert cache.load(uris[0]).getsize() > 1024
+    assert cache.usage() == {}
+    assert uris[0] not in cache.index
+
+
+def test_local_feed(config, abspath, tmp_path):
+    path = tmp_path / "feed.xml"
+    with open(abspath("rssfeed.xml"), "rb") as f:
+        path.write_bytes(f.read())
+    cache = backend.PodcastFeedCache(config)
+    uri = "podcast+" + path.as_uri()
+    feed = cache.load(uri)
+    assert uri in cache
+    with mock.patch.object(backend.feeds, "parse") as parse:
+        assert cache.load(uri) is feed
+    assert not parse.called
+    path.write_bytes(path.read_bytes().replace(b"Everything", b"Nothing"))
+    assert cache.load(uri) is not feed
+    assert cache.load(uri).gettrack(next(feed.tracks()).uri).album.name == (
+        "All About Nothing"
+    )
+    path.unlink()
+    with pytest.raises(urllib.error.URLError):
+        cache.load(uri)
+
+
+def test_invalidate(config, abspath, tmp_path):
+    config["podcast"]["fetch_wait"] = 1
+    path = tmp_path / "feed.xml"
+    with open(abspath("rssfeed.xml"), "rb") as f:
+        path.write_bytes(f.read())
+    cache = backend.PodcastFeedCache(config)
+    uri = "podcast+" + path.as_uri()
+    feed = cache.load(uri)
+    path.write_bytes(path.read_bytes().replace(b"Everything", b"Nothing"))
+    with mock.patch.object(backend.feeds, "parse") as parse:
+        start = time.monotonic()
+        cache.invalidate(uri)
+        assert time.monotonic() - start < 1
+    assert not parse.called
+    assert uri not in cache
+    assert cache.load(uri) is not feed
+
+
+@pytest.mark.parametrize("threshold", [0, 1024])
+def test_parser_processes(config, opener, threshold):
+    config["podcast"]["cache_persist"] = False
+    config["podcast"]["parser_processes"] = 1
+    config["podcast"]["parser_threshold"] = threshold
+    cache = backend.PodcastFeedCache(config)
+    uri = "podcast+http://example.com/feed.xml"
+    with mock.patch.object(backend.feeds, "parse", wraps=backend.feeds.parse):
+        feed = cache.load(uri)
+        assert backend.feeds.parse.called == bool(threshold)
+    assert feed.uri == uri
+    assert len(list(feed.tracks())) == 3
+    cache.close()
+
+
+def test_stats(config, opener):
+    uri = "podcast+http://example.com/feed.xml"
+    podcast = backend.PodcastBackend(config, None)
+    tracks = podcast.library.lookup(uri)
+    podcast.library.lookup(uri)
+    podcast.playback.translate_uri(tracks[0].uri)
+    stats = podcast.stats()
+    assert stats["cache.misses"] == 1
+    assert stats["cache.hits"] == 2
+    assert stats["cache.count"] == 1
+    assert stats["fetch.bytes"] > 0
+    assert stats["parse.bytes"] == stats["fetch.bytes"]
+    assert stats["fetch.time"]["count"] == 1
+    assert stats["parse.time"]["count"] == 1
+    assert stats["library.lookup"]["count"] == 2
+    assert stats["playback.translate_uri"]["count"] == 1
+    assert podcast.stats("example.com")["cache.misses"] == 1
+    assert "library.lookup" not in podcast.stats("example.com")
+    podcast.on_stop()
+
+
+def test_stats_compressed(config, opener):
+    open_url = opener.open.side_effect
+
+    def open_compressed(request, timeout=None):
+        source = open_url(request, timeout)
+        source.decoder = mock.Mock(count=100)
+        return source
+
+    opener.open.side_effect = open_compressed
+    cache = backend.PodcastFeedCache(config)
+    cache.load("podcast+http://example.com/feed.xml")
+    stats = cache.metrics.stats()
+    assert stats["fetch.bytes"] == 100
+    assert stats["parse.bytes"] > 100
+
+
+def test_cache_dir(config, slow_opener, tmp_path):
+    config["podcast"]["cache_dir"] = str(tmp_path / "shared" / "feeds")
+    uri = "podcast+http://example.com/feed.xml"
+    caches = [backend.PodcastFeedCache(config) for _ in range(2)]
+    threads = [threading.Thread(target=c.fetch, args=(uri,)) for c in caches]
+    for thread in threads:
+        thread.start()
+    slow_opener.started.wait()
+    time.sleep(0.1)
+    slow_opener.finish.set()
+    for thread in threads:
+        thread.join()
+    assert slow_opener.open.call_count == 1
+    assert list(caches[0].load(uri).tracks()) == list(
+        caches[1].load(uri).tracks()
+    )
+    assert os.listdir(tmp_path / "shared" / "feeds")
+
+
+def test_cache_dir_revalidate(config, opener, tmp_path):
+    config["podcast"]["cache_dir"] = str(tmp_path / "shared" / "feeds")
+    uri = "podcast+http://example.com/feed.xml"
+    cache = backend.PodcastFeedCache(config)
+    cache.fetch(uri)
+    assert opener.open.call_count == 1
+    # revalidated by another process after the feed was loaded
+    backend.PodcastFeedCache(config).fetch(uri, revalidate=True)
+    assert opener.open.call_count == 2
+    cache.fetch(uri, revalidate=True)
+    assert opener.open.call_count == 2
+    # revalidated by another process during the current refresh interval
+    config["podcast"]["refresh_interval"] = 3600
+    for _ in range(12):
+        backend.PodcastFeedCache(config).fetch(uri, revalidate=True)
+    assert opener.open.call_count == 2
+    # explicit invalidation still forces revalidation
+    cache.invalidate(uri)
+    cache.fetch(uri, revalidate=True)
+    assert opener.open.call_count == 3
+
+
+def test_cache_ttl_min(config, opener):
+    config["podcast"]["cache_ttl_min"] = 1
+    uri = "podcast+http://example.com/feed.xml"
+    cache = backend.PodcastFeedCache(config)
+    with mock.patch.object(backend.feeds.RssFeed, "getinterval") as interval:
+        interval.return_value = 4  # one second TTL
+        cache.fetch(uri)
+        cache.fetch(uri, revalidate=True)
+        assert opener.open.call_count == 1
+        time.sleep(1)
+        cache.fetch(uri, revalidate=True)
+        assert opener.open.call_count == 2
+        interval.return_value = None  # use cache_ttl
+        time.sleep(1)
+        cache.fetch(uri, revalidate=True)
+        assert opener.open.call_count == 2
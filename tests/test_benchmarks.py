@@ -0,0 +1,36 @@
+import uritools
+
+import pytest
+from benchmarks import __main__ as benchmarks
+from benchmarks import generate
+from mopidy_podcast import feeds
+
+
+@pytest.mark.parametrize("items", [0, 1, 100])
+def test_rss(items):
+    feed = feeds.fromstring(generate.rss(items), "http://example.com/")
+    assert len(list(feed.tracks())) == items
+
+
+def test_opml_tree(tmp_path):
+    filename = generate.opml_tree(str(tmp_path), fanout=3, depth=2, items=2)
+    root = feeds.parse(filename)
+    assert len(list(root.items())) == 3
+    for ref in root.items():
+        child = feeds.parse(uritools.urisplit(ref.uri).path)
+        assert len(list(child.items())) == 3
+
+
+def test_main(tmp_path, capsys):
+    output = str(tmp_path / "results.json")
+    argv = ["-s", "10", "-f", "2", "-r", "1", "-o", output]
+    assert benchmarks.main(argv) == 0
+    assert benchmarks.main(argv + ["-c", output, "-t", "1000"]) == 0
+    assert "lookup" in capsys.readouterr().out
+
+
+def test_latency(tmp_path, capsys):
+    output = str(tmp_path / "results.json")
+    argv = ["-s", "10", "-f", "2", "-r", "1", "-k", "browse_p", "-o", output]
+    assert benchmarks.main(argv + ["-l", "5", "--delay", "0.01"]) == 0
+    assert "browse_p99" in capsys.readouterr().out
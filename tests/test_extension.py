@@ -15,10 +15,27 @@ def test_get_config_schema():
     schema = Extension().get_config_schema()
     assert "browse_root" in schema
     assert "browse_order" in schema
+    assert "browse_limit" in schema
+    assert "latest_limit" in schema
     assert "lookup_order" in schema
+    assert "comment_limit" in schema
+    assert "search_limit" in schema
     assert "cache_size" in schema
+    assert "cache_memory" in schema
     assert "cache_ttl" in schema
+    assert "cache_ttl_min" in schema
+    assert "cache_grace" in schema
+    assert "cache_persist" in schema
+    assert "cache_dir" in schema
     assert "timeout" in schema
+    assert "parser" in schema
+    assert "parser_processes" in schema
+    assert "parser_threshold" in schema
+    assert "fetch_wait" in schema
+    assert "refresh_interval" in schema
+    assert "refresh_workers" in schema
+    assert "refresh_host_limit" in schema
+    assert "redirect_ttl" in schema
 
 
 def test_setup():
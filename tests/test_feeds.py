@@ -13,3 +13,49 @@ def test_parse(abspath, filename, expected):
     feed = feeds.parse(path)
     assert isinstance(feed, expected)
     assert feed.uri == uritools.uricompose("podcast+file", "", path)
+
+
+@pytest.mark.parametrize(
+    "xml",
+    [
+        "<html><body/></html>",
+        "<rss version='2.0'><item><title>Orphan</title></item></rss>",
+    ],
+)
+def test_parse_error(xml):
+    from io import StringIO
+
+    class StringSource(StringIO):
+        def geturl(self):
+            return "http://example.com/feed.xml"
+
+    with pytest.raises(TypeError):
+        feeds.parse(StringSource(xml))
+
+
+@pytest.mark.parametrize("engine", sorted(feeds.ENGINES))
+@pytest.mark.parametrize("filename", ["directory.xml", "rssfeed.xml"])
+def test_parse_engine(abspath, filename, engine):
+    path = abspath(filename)
+    feed = feeds.parse(path, engine=engine)
+    expected = feeds.parse(path, engine="stdlib")
+    assert list(feed.items()) == list(expected.items())
+    assert list(feed.tracks()) == list(expected.tracks())
+
+
+def test_parse_recover():
+    from io import BytesIO
+
+    pytest.importorskip("lxml")
+
+    class BytesSource(BytesIO):
+        def geturl(self):
+            return "http://example.com/feed.xml"
+
+    xml = b"""<rss><channel><title>Q & A</title><item>
+<title>Episode 1</title><enclosure url="http://example.com/1.mp3"/>
+</item></channel></rss>"""
+    with pytest.raises(feeds.ElementTree.ParseError):
+        feeds.parse(BytesSource(xml))
+    feed = feeds.parse(BytesSource(xml), engine="lxml")
+    assert [ref.name for ref in feed.items()] == ["Episode 1"]
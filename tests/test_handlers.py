@@ -0,0 +1,95 @@
+import gzip
+import http.server
+import threading
+import zlib
+
+import pytest
+from mopidy_podcast import Extension
+
+DATA = b"<rss><channel><title>Test</title></channel></rss>" * 100
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        self.server.encodings.append(self.headers.get("Accept-Encoding"))
+        if self.path == "/gzip":
+            body, encoding = gzip.compress(DATA), "gzip"
+        elif self.path == "/deflate":
+            body, encoding = zlib.compress(DATA), "deflate"
+        elif self.path == "/raw":
+            compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+            body = compressor.compress(DATA) + compressor.flush()
+            encoding = "deflate"
+        else:
+            body, encoding = DATA, None
+        self.send_response(200)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+    server.clients = set()
+    server.encodings = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def opener():
+    opener = Extension.get_url_opener({"proxy": {}})
+    yield opener
+    for handler in opener.handlers:
+        handler.close()
+
+
+def geturl(server, path):
+    host, port = server.server_address
+    return f"http://{host}:{port}{path}"
+
+
+@pytest.mark.parametrize("path", ["/plain", "/gzip", "/deflate", "/raw"])
+def test_content_encoding(server, opener, path):
+    with opener.open(geturl(server, path), timeout=5) as f:
+        assert f.read() == DATA
+        assert f.geturl() == geturl(server, path)
+        if path != "/plain":
+            assert 0 < f.decoder.count < len(DATA)
+            assert f.decoder.count == int(f.headers["Content-Length"])
+    assert server.encodings == ["deflate, gzip, x-gzip"]
+
+
+def test_keep_alive(server, opener):
+    for path in ["/plain", "/gzip", "/plain", "/deflate"]:
+        with opener.open(geturl(server, path), timeout=5) as f:
+            assert f.read() == DATA
+    assert len(server.clients) == 1
+
+
+def test_keep_alive_default_timeout(server, opener):
+    for path in ["/plain", "/gzip", "/plain"]:
+        with opener.open(geturl(server, path)) as f:
+            assert f.read() == DATA
+    assert len(server.clients) == 1
+
+
+def test_partial_read(server, opener):
+    with opener.open(geturl(server, "/plain"), timeout=5) as f:
+        assert f.read(10) == DATA[:10]
+    with opener.open(geturl(server, "/plain"), timeout=5) as f:
+        assert f.read() == DATA
+    assert len(server.clients) == 2
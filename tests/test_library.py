@@ -66,7 +66,9 @@ def test_lookup_error(library, uri, expected):
 def test_refresh(library, filename, abspath):
     feed = feeds.parse(abspath(filename))
     tracks = library.lookup(feed.uri)
-    assert feed.uri not in library.backend.feeds  # local feeds not cached!
+    assert feed.uri in library.backend.feeds
+    library.refresh()
+    assert feed.uri not in library.backend.feeds
     library.backend.feeds[feed.uri] = feed
     assert feed.uri in library.backend.feeds
     library.refresh(tracks[0].uri)
@@ -75,3 +77,110 @@ def test_refresh(library, filename, abspath):
     assert library.backend.feeds
     library.refresh()
     assert not library.backend.feeds
+
+
+@pytest.mark.parametrize("filename", ["rssfeed.xml"])
+def test_browse_limit(config, backend, filename, abspath):
+    config["podcast"]["browse_limit"] = 1
+    library = type(backend.library)(config, backend)
+    feed = feeds.parse(abspath(filename))
+    items = list(feed.items(newest_first=True))
+    refs = library.browse(feed.uri)
+    assert refs[:1] == items[:1]
+    assert [ref.name for ref in refs[1:]] == ["2014"]
+    refs = library.browse(refs[1].uri)
+    assert refs[:1] == items[:1]
+    assert [ref.name for ref in refs[1:]] == ["2014-06"]
+    assert library.browse(refs[1].uri) == items
+    assert library.lookup(refs[1].uri) == list(feed.tracks())
+
+
+def test_browse_undated(config, backend, tmp_path):
+    import re
+
+    from benchmarks import generate
+
+    data = re.sub(rb"<pubDate>[^<]*", b"<pubDate>unknown", generate.rss(4), 1)
+    path = tmp_path / "feed.xml"
+    path.write_bytes(data)
+    config["podcast"]["browse_limit"] = 2
+    library = type(backend.library)(config, backend)
+    feed = feeds.parse(str(path))
+    (undated,) = [t for t in feed.tracks() if not t.date]
+    refs = library.browse(feed.uri)
+    assert undated.uri not in [ref.uri for ref in refs]
+    assert "Undated" in [ref.name for ref in refs]
+    (directory,) = [ref for ref in refs if ref.name == "Undated"]
+    assert [ref.uri for ref in library.browse(directory.uri)] == [undated.uri]
+    assert library.lookup(directory.uri) == [undated]
+
+
+@pytest.mark.parametrize("filename", ["rssfeed.xml"])
+def test_comment_limit(config, backend, filename, abspath):
+    config["podcast"]["comment_limit"] = 0
+    library = type(backend.library)(config, backend)
+    feed = feeds.parse(abspath(filename))
+    tracks = library.lookup(feed.uri)
+    assert tracks == list(feed.tracks(comment_limit=0))
+    assert tracks[0].comment is None
+    assert library.lookup(tracks[0].uri) == tracks[:1]
+
+
+@pytest.mark.parametrize("filename", ["rssfeed.xml"])
+def test_search(library, filename, abspath):
+    feed = feeds.parse(abspath(filename))
+    assert library.search({"any": ["spices"]}).tracks == ()
+    library.backend.feeds[feed.uri] = feed
+    result = library.search({"any": ["spices"]})
+    assert [t.name for t in result.tracks] == ["Shake Shake Shake Your Spices"]
+    library.refresh()
+    assert library.search({"any": ["spices"]}).tracks == ()
+
+
+@pytest.mark.parametrize("limit", [None, 1, 7, 100])
+def test_latest(config, audio, tmp_path, limit):
+    from benchmarks import generate
+    from mopidy_podcast import backend
+
+    def write(name, data):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path), path.as_uri()
+
+    paths, urls = [], []
+    for index, name in enumerate("abc"):
+        path, url = write(name + ".xml", generate.rss(10, name, seed=index))
+        paths.append(path)
+        urls.append(url)
+    root, root_url = write("root.opml", b"")
+    _, sub_url = write(
+        "sub.opml",
+        generate.opml(
+            [
+                ("rss", "b", urls[1]),
+                ("rss", "c", urls[2]),
+                ("include", "root", root_url),
+            ]
+        ),
+    )
+    write(
+        "root.opml",
+        generate.opml([("rss", "a", urls[0]), ("include", "sub", sub_url)]),
+    )
+    config["podcast"]["browse_root"] = root
+    config["podcast"]["latest_limit"] = limit
+    library = backend.PodcastBackend(config, audio).library
+
+    refs = library.browse(library.root_directory.uri)
+    latest = library.browse("podcast:latest")
+    if not limit:
+        assert "podcast:latest" not in [ref.uri for ref in refs]
+        assert latest == []
+        return
+    assert refs[0].uri == "podcast:latest"
+    pairs = [p for path in paths for p in feeds.parse(path).latest()]
+    timestamps = {ref.uri: timestamp for timestamp, ref in pairs}
+    expected = sorted(timestamps.values(), reverse=True)[:limit]
+    assert [timestamps[ref.uri] for ref in latest] == expected
+    tracks = library.lookup("podcast:latest")
+    assert [track.uri for track in tracks] == [ref.uri for ref in latest]
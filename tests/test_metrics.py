@@ -0,0 +1,54 @@
+import logging
+
+from mopidy_podcast import metrics
+
+
+def test_counters():
+    m = metrics.Metrics()
+    m.count("hits", "example.com")
+    m.count("hits", "example.org", 2)
+    m.count("misses")
+    assert m.keys() == ["example.com", "example.org"]
+    assert m.stats() == {"hits": 3, "misses": 1}
+    assert m.stats("example.org") == {"hits": 2}
+    assert m.stats("example.net") == {}
+
+
+def test_histograms():
+    m = metrics.Metrics()
+    for value in (0.002, 0.02, 2):
+        m.observe("time", value, "example.com")
+    stats = m.stats()["time"]
+    assert stats["count"] == 3
+    assert stats["min"] == 0.002
+    assert stats["max"] == 2
+    assert stats["buckets"]["<=0.005"] == 1
+    assert stats["buckets"]["<=0.05"] == 1
+    assert stats["buckets"]["<=5"] == 1
+    assert sum(stats["buckets"].values()) == 3
+    assert m.stats("example.com")["time"] == stats
+
+
+def test_timer():
+    m = metrics.Metrics()
+    try:
+        with m.timer("time"):
+            raise ValueError()
+    except ValueError:
+        pass
+    assert m.stats()["time"]["count"] == 1
+    m.clear()
+    assert m.stats() == {}
+
+
+def test_log(caplog):
+    m = metrics.Metrics()
+    m.count("hits", "example.com")
+    m.observe("time", 1.0)
+    with caplog.at_level(logging.DEBUG):
+        m.log(logging.getLogger(__name__))
+    assert caplog.messages == [
+        "hits[total]: 1",
+        "time[total]: count=1 mean=1.000 max=1.000",
+        "hits[example.com]: 1",
+    ]
@@ -0,0 +1,36 @@
+from unittest import mock
+
+import uritools
+from mopidy_podcast import feeds, refresh
+
+
+def test_refresh(abspath):
+    root = feeds.parse(abspath("directory.xml"))
+    cache = mock.Mock()
+    cache.subscriptions.return_value = list(root.items())
+    refresher = refresh.PodcastFeedRefresher(cache, root.uri, interval=60)
+    try:
+        refresher.refresh()
+    finally:
+        refresher.stop()
+    cache.subscriptions.assert_called_once_with(root.uri)
+    assert sorted(c.args for c in cache.fetch.call_args_list) == sorted(
+        (ref.uri, True) for ref in root.items()
+    )
+
+
+def test_refresh_error(abspath):
+    root = feeds.parse(abspath("directory.xml"))
+    cache = mock.Mock()
+    cache.subscriptions.return_value = list(root.items())
+    cache.fetch.side_effect = Exception("error")
+    refresher = refresh.PodcastFeedRefresher(
+        cache, root.uri, interval=60, workers=1, host_limit=1
+    )
+    try:
+        refresher.refresh(revalidate=False)
+    finally:
+        refresher.stop()
+    hosts = {uritools.urisplit(ref.uri).gethost() for ref in root.items()}
+    assert len(hosts) > 1
+    assert cache.fetch.call_count == len(list(root.items()))
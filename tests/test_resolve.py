@@ -0,0 +1,106 @@
+import http.server
+import threading
+import time
+from unittest import mock
+
+import pytest
+from mopidy_podcast import Extension, feeds, resolve
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    REDIRECTS = {"/track": "/redirect", "/redirect": "/media.mp3"}
+
+    def do_HEAD(self):
+        self.server.requests.append(self.path)
+        if self.path in self.REDIRECTS:
+            self.send_response(302)
+            self.send_header("Location", self.REDIRECTS[self.path])
+        elif self.path == "/media.mp3":
+            self.send_response(200)
+        else:
+            self.send_response(405)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def resolver():
+    opener = Extension.get_url_opener({"proxy": {}})
+    resolver = resolve.RedirectResolver(opener, ttl=60, timeout=5)
+    yield resolver
+    resolver.close()
+
+
+def geturl(server, path):
+    host, port = server.server_address
+    return f"http://{host}:{port}{path}"
+
+
+def test_resolve(server, resolver):
+    url = geturl(server, "/track")
+    assert resolver.resolve(url) == geturl(server, "/media.mp3")
+    assert server.requests == ["/track", "/redirect", "/media.mp3"]
+    assert resolver.resolve(url) == geturl(server, "/media.mp3")
+    assert len(server.requests) == 3
+
+
+def test_resolve_error(server, resolver):
+    url = geturl(server, "/unsupported")
+    assert resolver.resolve(url) == url
+    assert resolver.resolve(url) == url
+    assert server.requests == ["/unsupported"]
+    url = "http://127.0.0.1:1/track"
+    assert resolver.resolve(url) == url
+
+
+def test_warm(server, resolver):
+    urls = [geturl(server, "/track"), geturl(server, "/media.mp3")]
+    resolver.warm(urls * resolver.WARM_LIMIT)
+    while len(server.requests) < 4:
+        time.sleep(0.01)
+    assert resolver.resolve(urls[0]) == urls[1]
+    assert resolver.resolve(urls[1]) == urls[1]
+    time.sleep(0.1)
+    assert len(server.requests) == 4
+
+
+@pytest.mark.parametrize("filename", ["rssfeed.xml"])
+def test_playback(config, audio, filename, abspath):
+    from mopidy_podcast import backend
+
+    config["podcast"]["redirect_ttl"] = 60
+    with mock.patch.object(backend, "RedirectResolver") as resolver_class:
+        resolver = resolver_class.return_value
+        resolver.resolve.side_effect = lambda url: url + "?resolved"
+        podcast = backend.PodcastBackend(config, audio)
+    feed = feeds.parse(abspath(filename))
+    tracks = podcast.library.lookup(feed.uri)
+    resolver.warm.assert_not_called()
+    assert podcast.library.lookup(tracks[0].uri) == tracks[:1]
+    (urls,), _ = resolver.warm.call_args
+    guid = tracks[0].uri.partition("#")[2]
+    assert list(urls) == [feed.getstreamuri(guid)]
+    resolver.warm.reset_mock()
+    assert not podcast.library.lookup(feed.uri + "#nonexistent")
+    resolver.warm.assert_not_called()
+    for track in tracks:
+        assert podcast.playback.translate_uri(track.uri).endswith("?resolved")
+    podcast.on_stop()
+    resolver.close.assert_called_once_with()
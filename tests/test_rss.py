@@ -136,3 +136,203 @@ def test_images(rss):
             "#http://example.com/everything/Episode1.mp3"
         ): [models.Image(uri="http://example.com/everything/Podcast.jpg")],
     }
+
+
+def test_no_enclosure():
+    from io import StringIO
+
+    class StringSource(StringIO):
+        def geturl(self):
+            return "http://www.example.com/everything.xml"
+
+    xml = XML.replace(
+        '<enclosure url="http://example.com/everything/Episode2.mp3"',
+        '<enclosure href="http://example.com/everything/Episode2.mp3"',
+    )
+    feed = feeds.parse(StringSource(xml))
+    assert [ref.name for ref in feed.items()] == [
+        "Red, Whine, & Blue",
+        "Shake Shake Shake Your Spices",
+    ]
+
+
+def test_gettrack(rss, tracks):
+    for track in tracks:
+        assert rss.gettrack(track.uri) == track
+    assert rss.gettrack(rss.uri) is None
+    assert rss.gettrack(rss.uri + "#n/a") is None
+
+
+@pytest.mark.parametrize(
+    "limit,expected",
+    [
+        (None, "<p>Q &amp; A</p>" * 100),
+        (0, None),
+        (12, "Q & A Q & A\u2026"),
+        (1000, " ".join(["Q & A"] * 100)),
+    ],
+)
+def test_comment(limit, expected):
+    from io import StringIO
+    from xml.sax.saxutils import escape
+
+    class StringSource(StringIO):
+        def geturl(self):
+            return "http://www.example.com/everything.xml"
+
+    description = "<p>Q &amp; A</p>" * 100
+    xml = XML.replace(
+        "<guid>episode3</guid>",
+        "<guid>episode3</guid><description>%s</description>"
+        % escape(description),
+    )
+    feed = feeds.parse(StringSource(xml))
+    uri = feed.getitemuri("episode3")
+    assert feed.gettrack(uri).comment == description
+    assert feed.gettrack(uri, limit).comment == expected
+    tracks = feed.tracks(newest_first=True, comment_limit=limit)
+    assert next(tracks).comment == expected
+    # stored compressed
+    assert feed.getsize() < feeds.parse(StringSource(XML)).getsize() + 500
+
+
+def test_getstreamuri(rss):
+    assert rss.getstreamuri("episode3") == (
+        "http://example.com/everything/Episode3.m4a"
+    )
+    assert rss.getstreamuri("http://example.com/everything/Episode1.mp3") == (
+        "http://example.com/everything/Episode1.mp3"
+    )
+    assert rss.getstreamuri("n/a") is None
+
+
+def test_getimages(rss):
+    for uri, images in rss.images():
+        assert rss.getimages(uri) == images
+    assert rss.getimages(rss.uri + "#n/a") == []
+
+
+def test_periods(rss):
+    assert list(rss.periods()) == [("2014", 3)]
+    assert list(rss.periods("2014")) == [("2014-06", 3)]
+    assert list(rss.periods("2014-06")) == []
+    assert list(rss.periods("2015")) == []
+
+
+def test_periods_undated():
+    xml = XML.replace("<pubDate>Wed, 8 Jun 2014 19:00:00 GMT</pubDate>", "")
+    feed = feeds.fromstring(xml.encode(), "http://example.com/feed.xml")
+    assert list(feed.periods()) == [("undated", 1), ("2014", 2)]
+    assert list(feed.periods("undated")) == []
+    assert [ref.name for ref in feed.items(period="undated")] == [
+        "Socket Wrench Shootout"
+    ]
+    assert len(list(feed.tracks(period="undated"))) == 1
+
+
+def test_items_period(rss, items):
+    assert list(rss.items(True, limit=1)) == items[:1]
+    assert list(rss.items(False, limit=2)) == list(reversed(items[:2]))
+    assert list(rss.items(True, "2014")) == items
+    assert list(rss.items(True, "2014-06", 2)) == items[:2]
+    assert list(rss.items(True, "2015")) == []
+
+
+def test_tracks_period(rss, tracks):
+    assert list(rss.tracks(True, "2014-06")) == tracks
+    assert list(rss.tracks(True, "2014-05")) == []
+
+
+def test_shared_models(rss):
+    tracks = list(rss.tracks()) + list(rss.tracks())
+    assert all(track.album is tracks[0].album for track in tracks)
+    assert tracks[1].artists is tracks[4].artists
+    assert rss.gettrack(tracks[0].uri).album is tracks[0].album
+
+
+def test_getsize(abspath):
+    feed = feeds.parse(abspath("rssfeed.xml"))
+    size = feed.getsize()
+    assert size > 0
+    assert feed.getsize() == size
+    assert feeds.parse(abspath("directory.xml")).getsize() < size
+
+
+def test_previous(rss, tracks):
+    from io import StringIO
+    from unittest import mock
+
+    class StringSource(StringIO):
+        def geturl(self):
+            return "http://www.example.com/everything.xml"
+
+    xml = XML.replace(
+        "<title>Socket Wrench Shootout</title>",
+        "<title>Socket Wrench Shootout (Updated)</title>",
+    ).replace(
+        "<item>",
+        """<item>
+<title>Hello</title>
+<enclosure url="http://example.com/everything/Episode4.mp3" />
+<pubDate>Wed, 22 Jun 2014 19:00:00 GMT</pubDate>
+</item>
+<item>""",
+        1,
+    )
+    parsedate = feeds.email.utils.parsedate_tz
+    with mock.patch.object(
+        feeds.email.utils, "parsedate_tz", side_effect=parsedate
+    ) as mock_parsedate:
+        feed = feeds.parse(StringSource(xml), rss)
+    assert mock_parsedate.call_count == 2
+    assert list(feed.tracks()) == list(feeds.parse(StringSource(xml)).tracks())
+    assert [ref.name for ref in feed.items(newest_first=True)] == [
+        "Hello",
+        tracks[0].name,
+        "Socket Wrench Shootout (Updated)",
+        tracks[2].name,
+    ]
+
+
+def test_getinterval(rss):
+    from unittest import mock
+
+    week = 7 * 24 * 60 * 60
+    latest = 1402858800  # Wed, 15 Jun 2014 19:00:00 GMT
+    with mock.patch.object(feeds.time, "time", return_value=latest + 3600):
+        assert rss.getinterval() == week
+    with mock.patch.object(feeds.time, "time", return_value=latest + 2 * week):
+        assert rss.getinterval() == 2 * week
+    assert rss.getinterval(count=1) > week
+
+
+@pytest.mark.parametrize("engine", sorted(feeds.ENGINES))
+def test_previous_other_process(engine):
+    import os
+    import pickle
+    import subprocess
+    import sys
+    from unittest import mock
+
+    # feeds restored from the persistent cache may have been parsed by
+    # another process, using a different hash seed
+    url = "http://www.example.com/everything.xml"
+    xml = XML.replace("<item>", "<item><!-- comment --><?pi data?>").encode()
+    code = (
+        "import pickle, sys; from mopidy_podcast import feeds; "
+        "feed = feeds.fromstring(sys.stdin.buffer.read(), %r, None, %r); "
+        "sys.stdout.buffer.write(pickle.dumps(feed))" % (url, engine)
+    )
+    previous = pickle.loads(
+        subprocess.run(
+            [sys.executable, "-c", code],
+            input=xml,
+            stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONHASHSEED="1"),
+            check=True,
+        ).stdout
+    )
+    with mock.patch.object(feeds.email.utils, "parsedate_tz") as parsedate:
+        feed = feeds.fromstring(xml, url, previous, engine)
+    assert not parsedate.called
+    assert [t.uri for t in feed.tracks()] == [t.uri for t in previous.tracks()]
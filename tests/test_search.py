@@ -0,0 +1,98 @@
+import pytest
+from mopidy_podcast import feeds, search
+
+
+@pytest.fixture
+def feed(abspath):
+    return feeds.parse(abspath("rssfeed.xml"))
+
+
+@pytest.fixture
+def index(feed):
+    index = search.PodcastSearchIndex()
+    index.add(feed.uri, feed)
+    return index
+
+
+def names(tracks):
+    return [track.name for track in tracks]
+
+
+def test_tokenize():
+    assert search.tokenize(None) == []
+    assert search.tokenize("<a href='x'>Red, Whine</a>") == ["red", "whine"]
+
+
+def test_search(index):
+    assert names(index.search({"track_name": ["shake"]})) == [
+        "Shake Shake Shake Your Spices"
+    ]
+    assert names(index.search({"track_name": ["spic"]})) == [
+        "Shake Shake Shake Your Spices"
+    ]
+    assert names(index.search({"any": ["everything"]})) == [
+        "Shake Shake Shake Your Spices",
+        "Socket Wrench Shootout",
+        "Red,Whine, & Blue",
+    ]
+    assert names(index.search({"album": ["all about"], "any": ["red"]})) == [
+        "Red,Whine, & Blue"
+    ]
+    assert index.search({"track_name": ["shake"], "album": ["nothing"]}) == []
+    assert index.search({"genre": ["technology"]}) == []
+    assert index.search({}) == []
+
+
+def test_search_exact(index):
+    assert names(index.search({"track_name": ["shake"]}, exact=True)) == []
+    assert names(
+        index.search({"track_name": ["Socket Wrench Shootout"]}, exact=True)
+    ) == ["Socket Wrench Shootout"]
+
+
+def test_search_limit(index):
+    assert len(index.search({"any": ["everything"]}, limit=2)) == 2
+
+
+def test_search_limit_tracks(index, feed):
+    from unittest import mock
+
+    with mock.patch.object(
+        feeds.RssFeed,
+        "gettrack",
+        autospec=True,
+        side_effect=feeds.RssFeed.gettrack,
+    ) as gettrack:
+        tracks = index.search({"any": ["everything"]}, limit=1)
+    assert names(tracks) == ["Shake Shake Shake Your Spices"]
+    assert gettrack.call_count == 1
+
+
+def test_search_uris(index, feed):
+    query = {"any": ["everything"]}
+    assert len(index.search(query, uris=[feed.uri])) == 3
+    assert len(index.search(query, uris=["podcast:"])) == 3
+    other = "podcast+http://example.com/other.xml"
+    assert index.search(query, uris=[other]) == []
+
+
+def test_redirect(feed):
+    uri = "podcast+http://example.com/redirected.xml"
+    index = search.PodcastSearchIndex()
+    index.add(uri, feed)
+    assert uri in index
+    assert len(index.search({"any": ["everything"]}, uris=[uri])) == 3
+    assert len(index.search({"any": ["everything"]}, uris=[feed.uri])) == 3
+    index.remove(uri)
+    assert uri not in index
+    assert index.search({"any": ["everything"]}) == []
+
+
+def test_remove(index, feed):
+    assert feed.uri in index
+    index.remove(feed.uri)
+    assert feed.uri not in index
+    assert index.search({"any": ["everything"]}) == []
+    index.add(feed.uri, feed)
+    index.add(feed.uri, feed)
+    assert len(index.search({"any": ["everything"]})) == 3
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+
+from mopidy_podcast import feeds, store
+
+
+def test_load_save(abspath, tmp_path):
+    feed = feeds.parse(abspath("rssfeed.xml"))
+    feedstore = store.FeedStore(str(tmp_path))
+    assert feedstore.load(feed.uri) is None
+    feedstore.save(feed.uri, feed, '"etag"', "Wed, 15 Jun 2014 19:00:00 GMT")
+    entry = feedstore.load(feed.uri)
+    assert list(entry.feed.tracks()) == list(feed.tracks())
+    assert entry.etag == '"etag"'
+    assert entry.modified == "Wed, 15 Jun 2014 19:00:00 GMT"
+    assert entry.timestamp <= time.time()
+
+
+def test_expire(abspath, tmp_path):
+    feed = feeds.parse(abspath("rssfeed.xml"))
+    feedstore = store.FeedStore(str(tmp_path))
+    feedstore.save(feed.uri, feed)
+    feedstore.expire(feed.uri)
+    assert feedstore.load(feed.uri).timestamp == 0
+    feedstore.touch(feed.uri)
+    assert feedstore.load(feed.uri).timestamp > 0
+    feedstore.expire()
+    assert feedstore.load(feed.uri).timestamp == 0
+
+
+def test_load_error(tmp_path):
+    feedstore = store.FeedStore(str(tmp_path))
+    feedstore.save("podcast+http://example.com/feed.xml", None)
+    for path in tmp_path.iterdir():
+        path.write_bytes(b"garbage")
+    assert feedstore.load("podcast+http://example.com/feed.xml") is None
+
+
+def test_lock(tmp_path):
+    uri = "podcast+http://example.com/feed.xml"
+    first, second = store.FeedStore(str(tmp_path)), store.FeedStore(
+        str(tmp_path)
+    )
+    waited = []
+
+    def lock():
+        with second.lock(uri) as result:
+            waited.append(result)
+
+    with first.lock(uri) as result:
+        assert result is False
+        thread = threading.Thread(target=lock)
+        thread.start()
+        time.sleep(0.1)
+        assert waited == []
+    thread.join()
+    assert waited == [True]
+    with first.lock(uri) as result:
+        assert result is False
+
+
+def test_prune(abspath, tmp_path):
+    feed = feeds.parse(abspath("rssfeed.xml"))
+    feedstore = store.FeedStore(str(tmp_path))
+    feedstore.save(feed.uri, feed)
+    feedstore.save("podcast+http://example.com/feed.xml", feed)
+    with feedstore.lock(feed.uri):
+        pass
+    (tmp_path / "orphan.tmp").write_bytes(b"")
+    assert feedstore.prune(3600) == 0
+    feedstore.expire(feed.uri)
+    os.utime(tmp_path / "orphan.tmp", (0, 0))
+    assert feedstore.prune(3600) == 2
+    assert feedstore.load(feed.uri) is None
+    assert feedstore.load("podcast+http://example.com/feed.xml") is not None
+    assert len(list(tmp_path.iterdir())) == 2